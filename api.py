@@ -0,0 +1,328 @@
+"""JSON order API, for integrations such as order_actions.js.
+
+    POST /api/place_order        {user_id, product, quantity}
+    POST /api/cancel_order       {user_id, order_id}
+    GET  /api/view_orders        ?user_id=
+
+    GET  /api/v1/orders          ?user_id=&fields=&limit=&cursor=   one user's orders, newest first
+    POST /api/v1/orders          {orders: [{user_id, items, shipping_address, idempotency_key}]}
+    POST /api/v1/orders/lookup   {order_ids: [...], fields: [...]}
+    POST /api/v1/orders/cancel   {order_ids: [...]}
+
+A logged-in session acts for its own user. Without one, requests must carry
+the API_KEY as `Authorization: Bearer <key>` and may act for any user_id.
+Batch endpoints take up to API_MAX_BATCH orders or ids and use one set-based
+query per chunk of ids. `fields` (comma-separated or a list) trims each order
+to the named ORDER_FIELDS; items are only fetched when asked for. Responses of
+at least API_GZIP_MIN_SIZE bytes are gzipped for clients that accept it.
+"""
+import gzip
+import hmac
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import Blueprint, current_app, jsonify, request, session
+
+import order_history
+from cart_pricing import MAX_IDS_PER_QUERY, fetch_products, price_cart
+from catalog import catalog
+from db import get_db
+from order_status import cancel_orders
+from order_writer import Order, OrderWriterBusy
+from recommendations import recommender
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+ORDER_FIELDS = ('id', 'user_id', 'total', 'status', 'shipping_address', 'created_at', 'items')
+# Orders per page of GET /api/v1/orders
+DEFAULT_LIMIT = 20
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(APIError)
+def api_error(e):
+    return jsonify({"error": e.message}), e.status
+
+
+def init_app(app):
+    app.config.setdefault('API_KEY', None)
+    app.config.setdefault('API_MAX_BATCH', 1000)
+    app.config.setdefault('API_GZIP_MIN_SIZE', 1024)
+    app.register_blueprint(api)
+
+
+def _has_api_key():
+    key = current_app.config['API_KEY']
+    header = request.headers.get('Authorization', '')
+    # Compared as bytes: compare_digest refuses str with non-ASCII characters
+    return (bool(key) and header.startswith('Bearer ')
+            and hmac.compare_digest(header[7:].encode(), key.encode()))
+
+
+def _as_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise APIError(f'{name} must be an integer')
+
+
+def acting_user(user_id, required=True):
+    """The user a request acts for: the session's user, or any user_id with the API key.
+
+    None means every user, which only the API key may ask for.
+    """
+    if session.get('user_id') is not None:
+        if user_id is not None and _as_int(user_id, 'user_id') != session['user_id']:
+            raise APIError('Not allowed to act for another user', 403)
+        return session['user_id']
+    if not _has_api_key():
+        raise APIError('Log in or send the API key', 401)
+    if user_id is None:
+        if required:
+            raise APIError('user_id is required')
+        return None
+    return _as_int(user_id, 'user_id')
+
+
+def _batch(values, name):
+    if not isinstance(values, list) or not values:
+        raise APIError(f'{name} must be a non-empty list')
+    if len(values) > current_app.config['API_MAX_BATCH']:
+        raise APIError(f"At most {current_app.config['API_MAX_BATCH']} {name} per request", 413)
+    return values
+
+
+def _fields(value):
+    if value is None:
+        return ORDER_FIELDS
+    fields = value.split(',') if isinstance(value, str) else value
+    unknown = [field for field in fields if field not in ORDER_FIELDS]
+    if unknown:
+        raise APIError(f"Unknown fields: {', '.join(map(str, unknown))}; choose from {', '.join(ORDER_FIELDS)}")
+    return fields
+
+
+def _body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise APIError('Expected a JSON object')
+    return data
+
+
+def serialize_orders(conn, rows, fields):
+    """Order dicts with just fields, from fetch_orders_by_id() rows"""
+    items = order_history.fetch_order_items(conn, [row[0] for row in rows]) if 'items' in fields else {}
+    orders = []
+    for order_id, user_id, total, status, shipping_address, created_at in rows:
+        order = {'id': order_id, 'user_id': user_id, 'total': total, 'status': status,
+                 'shipping_address': shipping_address, 'created_at': created_at}
+        if 'items' in fields:
+            order['items'] = [{'product_id': product_id, 'name': name, 'quantity': quantity, 'price': price}
+                              for product_id, name, quantity, price in items.get(order_id, [])]
+        orders.append({field: order[field] for field in fields})
+    return orders
+
+
+def place_orders(conn, orders):
+    """Price and place [(user_id, {product_id: quantity}, shipping_address, idempotency_key)].
+
+    Every product is priced with one query, the orders go to the order writer
+    together, and the result is one {"order_id", "total"} or {"error"} per order.
+    """
+    products = fetch_products(conn, [product_id for _, cart, _, _ in orders for product_id in cart])
+    order_writer = current_app.extensions['shop'].order_writer
+    pending = []
+    for user_id, cart, shipping_address, idempotency_key in orders:
+        items, total = price_cart(cart, products)
+        if len(items) != len(cart):
+            pending.append({"error": "Unknown product"})
+            continue
+        try:
+            future = order_writer.submit(Order(user_id, items, total, shipping_address, idempotency_key))
+            pending.append((future, items, total))
+        except OrderWriterBusy:
+            pending.append({"error": "Too many orders in flight; retry later"})
+
+    results = []
+    for entry in pending:
+        if isinstance(entry, dict):
+            results.append(entry)
+            continue
+        future, items, total = entry
+        try:
+            order_id = future.result(timeout=order_writer.timeout)
+        except FutureTimeout:
+            future.cancel()
+            results.append({"error": "Timed out waiting for the order to be written"})
+            continue
+        except Exception as e:
+            results.append({"error": str(e)})
+            continue
+        recommender.record_order(item['id'] for item in items)
+        results.append({"order_id": order_id, "total": total})
+    return results
+
+
+def _existing_users(conn, user_ids):
+    ids = list(user_ids)
+    found = set()
+    for start in range(0, len(ids), MAX_IDS_PER_QUERY):
+        chunk = ids[start:start + MAX_IDS_PER_QUERY]
+        placeholders = ','.join(['?'] * len(chunk))
+        found.update(row[0] for row in conn.execute(f'SELECT id FROM users WHERE id IN ({placeholders})', chunk))
+    return found
+
+
+def _cart(items):
+    """{product_id: quantity} from [{product_id, quantity}], or None if any line is invalid"""
+    cart = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            return None
+        product_id, quantity = item.get('product_id'), item.get('quantity', 1)
+        if not isinstance(product_id, int) or not isinstance(quantity, int) or quantity < 1:
+            return None
+        cart[product_id] = cart.get(product_id, 0) + quantity
+    return cart or None
+
+
+def _latest_address(conn, user_id):
+    row = conn.execute('''
+        SELECT full_name, street, city, state, zip_code
+        FROM user_addresses WHERE user_id = ?
+        ORDER BY id DESC LIMIT 1
+    ''', (user_id,)).fetchone()
+    return f"{row[0]}, {row[1]}, {row[2]}, {row[3]} {row[4]}" if row else None
+
+
+@api.after_request
+def compress(response):
+    if (response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.content_length is None
+            or response.content_length < current_app.config['API_GZIP_MIN_SIZE']):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@api.route('/place_order', methods=['POST'])
+def place_order():
+    data = _body()
+    user_id = acting_user(data.get('user_id'))
+    product = catalog.find_by_name(str(data.get('product') or ''))
+    if not product:
+        raise APIError('Unknown product', 404)
+    quantity = _as_int(data.get('quantity', 1), 'quantity')
+    if quantity < 1:
+        raise APIError('quantity must be at least 1')
+
+    conn = get_db()
+    shipping_address = _latest_address(conn, user_id)
+    if not shipping_address:
+        raise APIError('No saved shipping address; check out once on the website first')
+    result = place_orders(conn, [(user_id, {product[0]: quantity}, shipping_address, None)])[0]
+    if 'error' in result:
+        raise APIError(result['error'], 503)
+    return jsonify({"order_id": result['order_id'], "product": product[1], "quantity": quantity,
+                    "total": result['total'], "status": "pending"})
+
+
+@api.route('/cancel_order', methods=['POST'])
+def cancel_order():
+    data = _body()
+    user_id = acting_user(data.get('user_id'))
+    order_id = _as_int(data.get('order_id'), 'order_id')
+    if cancel_orders(get_db(), [order_id], user_id):
+        return jsonify({"order_id": order_id, "status": "cancelled"})
+
+    rows = order_history.fetch_orders_by_id(get_db(), [order_id], user_id)
+    if not rows:
+        raise APIError('Order not found', 404)
+    raise APIError(f"Order is {rows[0][3]} and can no longer be cancelled", 409)
+
+
+@api.route('/view_orders')
+@api.route('/v1/orders', methods=['GET'])
+def list_orders():
+    user_id = acting_user(request.args.get('user_id'))
+    fields = _fields(request.args.get('fields'))
+    limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), current_app.config['API_MAX_BATCH']))
+
+    conn = get_db()
+    # Keyset-paginated like the orders page, then the page's rows and items by id
+    page = order_history.fetch_orders(conn, user_id, limit + 1, request.args.get('cursor'))
+    next_cursor = order_history.encode_cursor(page[limit - 1]) if len(page) > limit else None
+    rows = order_history.fetch_orders_by_id(conn, [row[0] for row in page[:limit]])
+    newest_first = sorted(rows, key=lambda row: (row[5], row[0]), reverse=True)
+    return jsonify({"orders": serialize_orders(conn, newest_first, fields), "next_cursor": next_cursor})
+
+
+@api.route('/v1/orders', methods=['POST'])
+def create_orders():
+    entries = _batch(_body().get('orders'), 'orders')
+    conn = get_db()
+
+    valid, results = [], [None] * len(entries)
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise APIError('Each order must be a JSON object')
+        user_id = acting_user(entry.get('user_id'))
+        cart = _cart(entry.get('items'))
+        if cart is None:
+            results[index] = {"error": "items must be a list of {product_id, quantity >= 1}"}
+        elif not entry.get('shipping_address'):
+            results[index] = {"error": "shipping_address is required"}
+        else:
+            valid.append((index, (user_id, cart, str(entry['shipping_address']), entry.get('idempotency_key'))))
+
+    # Orders for users that do not exist are rejected together, with one query
+    known = _existing_users(conn, {order[0] for _, order in valid})
+    for index, order in valid:
+        if order[0] not in known:
+            results[index] = {"error": "Unknown user"}
+    valid = [(index, order) for index, order in valid if order[0] in known]
+
+    for (index, _), result in zip(valid, place_orders(conn, [order for _, order in valid])):
+        results[index] = result
+    return jsonify({"results": results})
+
+
+@api.route('/v1/orders/lookup', methods=['POST'])
+def lookup_orders():
+    data = _body()
+    user_id = acting_user(data.get('user_id'), required=False)
+    order_ids = [_as_int(order_id, 'order_ids') for order_id in _batch(data.get('order_ids'), 'order_ids')]
+    fields = _fields(data.get('fields'))
+
+    conn = get_db()
+    rows = order_history.fetch_orders_by_id(conn, order_ids, user_id)
+    found = {row[0] for row in rows}
+    return jsonify({"orders": serialize_orders(conn, rows, fields),
+                    "missing": [order_id for order_id in dict.fromkeys(order_ids) if order_id not in found]})
+
+
+@api.route('/v1/orders/cancel', methods=['POST'])
+def cancel_orders_batch():
+    data = _body()
+    user_id = acting_user(data.get('user_id'), required=False)
+    order_ids = [_as_int(order_id, 'order_ids') for order_id in _batch(data.get('order_ids'), 'order_ids')]
+
+    conn = get_db()
+    cancelled = cancel_orders(conn, order_ids, user_id)
+    # Why the rest were not: one lookup for all of them
+    done = set(cancelled)
+    rest = [order_id for order_id in dict.fromkeys(order_ids) if order_id not in done]
+    statuses = {row[0]: row[3] for row in order_history.fetch_orders_by_id(conn, rest, user_id)}
+    return jsonify({
+        "cancelled": cancelled,
+        "not_cancelled": [{"order_id": order_id, "status": statuses.get(order_id, 'not_found')}
+                          for order_id in rest],
+    })
@@ -1,155 +1,239 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Blueprint, Flask, current_app, render_template, request, redirect, url_for, session,
+                   flash, jsonify)
 import sqlite3
 import hashlib
+import math
 import os
-from datetime import datetime, timedelta
+import threading
+import uuid
+from collections import namedtuple
 from chatbot import Chatbot  # Import chatbot class
-
-
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Set a secret key for session management
-chatbot = Chatbot()  # Initialize chatbot
-
-@app.route('/chatbot', methods=['POST'])
+import db
+from db import get_db
+from cart_pricing import fetch_products, price_cart
+from catalog import catalog
+import search
+import migrations
+import metrics
+from order_status import OrderStatusSweeper, delivered_at, refusal, sweep_delivered, transition
+from order_history import DEFAULT_PAGE_SIZE, backfill_summaries, fetch_order, fetch_order_page
+from nlp_worker import NLPUnavailable, NLPWorker
+from intent_cache import IntentCache
+from cart_store import create_cart_store
+from recommendations import recommender
+from order_writer import Order, OrderWriter, OrderWriterBusy, find_order
+import assets
+import api
+from rate_limit import ConcurrencyGate, create_rate_limiter
+from page_cache import PageCache, cached_page, order_versions
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+
+# The storefront's pages; create_app() registers them on an app
+shop = Blueprint('shop', __name__, cli_group=None)
+
+# Long-lived objects each app builds once and its requests share
+Services = namedtuple('Services', 'chatbot cart_store nlp_worker order_writer pages chat_limiter chat_gate')
+
+# The current app's services, for the views
+chatbot = LocalProxy(lambda: current_app.extensions['shop'].chatbot)
+cart_store = LocalProxy(lambda: current_app.extensions['shop'].cart_store)
+order_writer = LocalProxy(lambda: current_app.extensions['shop'].order_writer)
+pages = LocalProxy(lambda: current_app.extensions['shop'].pages)
+chat_limiter = LocalProxy(lambda: current_app.extensions['shop'].chat_limiter)
+chat_gate = LocalProxy(lambda: current_app.extensions['shop'].chat_gate)
+
+
+def load_config(app):
+    """Settings from the environment; create_app()'s config argument overrides them"""
+    app.config['DATABASE'] = os.environ.get('ECOMMERCE_DB', db.DEFAULT_DATABASE)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+    app.config['ORDERS_PAGE_SIZE'] = int(os.environ.get('ORDERS_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+    app.config['CHAT_CACHE_SIZE'] = int(os.environ.get('CHAT_CACHE_SIZE', 10000))
+    app.config['CHAT_CACHE_TTL'] = float(os.environ.get('CHAT_CACHE_TTL', 3600))
+    # Carts live in the database, keyed by user, with recently used ones cached in memory
+    app.config['CART_CACHE_SIZE'] = int(os.environ.get('CART_CACHE_SIZE', 10000))
+    app.config['CART_CACHE_TTL'] = float(os.environ.get('CART_CACHE_TTL', 60))
+    # Load the NLP model in the background at startup instead of on the first message
+    app.config['CHATBOT_WARMUP'] = os.environ.get('CHATBOT_WARMUP') == '1'
+    # spaCy runs on one worker thread that micro-batches concurrent messages
+    app.config['CHAT_NLP_BATCH_SIZE'] = int(os.environ.get('CHAT_NLP_BATCH_SIZE', 16))
+    app.config['CHAT_NLP_WAIT_MS'] = float(os.environ.get('CHAT_NLP_WAIT_MS', 5))
+    app.config['CHAT_NLP_QUEUE_SIZE'] = int(os.environ.get('CHAT_NLP_QUEUE_SIZE', 256))
+    app.config['CHAT_NLP_TIMEOUT'] = float(os.environ.get('CHAT_NLP_TIMEOUT', 5))
+    # Chat messages per minute for each user (or IP when logged out), after a burst; 0 turns it off
+    app.config['CHAT_RATE_LIMIT'] = float(os.environ.get('CHAT_RATE_LIMIT', 60))
+    app.config['CHAT_RATE_BURST'] = int(os.environ.get('CHAT_RATE_BURST', 20))
+    # Keep the buckets in SQLite so all worker processes share them
+    app.config['CHAT_RATE_LIMIT_SHARED'] = os.environ.get('CHAT_RATE_LIMIT_SHARED') == '1'
+    # Messages processed at once per process; more are turned away with 503 (0: no limit)
+    app.config['CHAT_MAX_CONCURRENT'] = int(os.environ.get('CHAT_MAX_CONCURRENT', 8))
+    app.config['CHAT_RETRY_AFTER'] = int(os.environ.get('CHAT_RETRY_AFTER', 1))
+    # Proxies in front of the app whose X-Forwarded-For is trusted for the client
+    # address (0: clients connect directly); logged-out clients are limited by it
+    app.config['PROXY_FIX_X_FOR'] = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    # Checkouts are committed in small groups by one writer thread
+    app.config['ORDER_WRITER_BATCH_SIZE'] = int(os.environ.get('ORDER_WRITER_BATCH_SIZE', 32))
+    app.config['ORDER_WRITER_WAIT_MS'] = float(os.environ.get('ORDER_WRITER_WAIT_MS', 2))
+    app.config['ORDER_WRITER_QUEUE_SIZE'] = int(os.environ.get('ORDER_WRITER_QUEUE_SIZE', 1024))
+    app.config['ORDER_WRITER_TIMEOUT'] = float(os.environ.get('ORDER_WRITER_TIMEOUT', 10))
+    # Optional in-process sweeper, in seconds; 0 leaves it to `flask sweep-orders`
+    app.config['ORDER_SWEEP_INTERVAL'] = float(os.environ.get('ORDER_SWEEP_INTERVAL', 0))
+    # Set SLOW_REQUEST_MS to log slow requests
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))
+    # Rendered product grid and order pages, keyed by catalog and order versions
+    app.config['PAGE_CACHE_SIZE'] = int(os.environ.get('PAGE_CACHE_SIZE', 1000))
+    app.config['PAGE_CACHE_TTL'] = float(os.environ.get('PAGE_CACHE_TTL', 300))
+    # Saved "bought together" index (python recommendations.py --output ...); unset: build from orders
+    app.config['RECOMMENDATIONS_INDEX'] = os.environ.get('RECOMMENDATIONS_INDEX')
+    # JSON API: partners authenticate with API_KEY; batches hold at most API_MAX_BATCH orders
+    app.config['API_KEY'] = os.environ.get('API_KEY')
+    app.config['API_MAX_BATCH'] = int(os.environ.get('API_MAX_BATCH', 1000))
+    app.config['API_GZIP_MIN_SIZE'] = int(os.environ.get('API_GZIP_MIN_SIZE', 1024))
+
+
+def load_secret_key(app):
+    """SECRET_KEY from the config, else the instance folder's secret_key file.
+
+    The file is created on first use, so every worker process and every
+    restart signs sessions with the same key.
+    """
+    if app.config['SECRET_KEY']:
+        return app.config['SECRET_KEY']
+
+    path = os.path.join(app.instance_path, 'secret_key')
+    os.makedirs(app.instance_path, exist_ok=True)
+    if not os.path.exists(path):
+        # Written in full under a temporary name, then linked into place: a
+        # worker that loses the race reads the winner's key, never a partial file
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(32))
+                f.flush()
+                os.fsync(f.fileno())
+            os.link(temp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def create_app(config=None):
+    """Build the app. Does not touch the schema; run init_db() (or `flask init-db`) once first."""
+    app = Flask(__name__, instance_relative_config=True)
+    load_config(app)
+    app.config.update(config or {})
+    app.config['SECRET_KEY'] = load_secret_key(app)
+    db.init_app(app)  # Pooled, request-scoped database connections
+
+    cart_store = create_cart_store(cache_size=app.config['CART_CACHE_SIZE'],
+                                   cache_ttl=app.config['CART_CACHE_TTL'])
+    # The NLP model loads on first use, at warm-up, or before forking (see wsgi.py)
+    chatbot = Chatbot(intent_cache=IntentCache(app.config['CHAT_CACHE_SIZE'], app.config['CHAT_CACHE_TTL']),
+                      cart_store=cart_store)
+    if app.config['CHATBOT_WARMUP']:
+        chatbot.warm_up()
+    nlp_worker = NLPWorker(lambda: chatbot.nlp,
+                           batch_size=app.config['CHAT_NLP_BATCH_SIZE'],
+                           wait=app.config['CHAT_NLP_WAIT_MS'] / 1000,
+                           queue_size=app.config['CHAT_NLP_QUEUE_SIZE'],
+                           timeout=app.config['CHAT_NLP_TIMEOUT'])
+    chatbot.vectorizer = nlp_worker.vector
+    order_writer = OrderWriter(app.config['DATABASE'],
+                               batch_size=app.config['ORDER_WRITER_BATCH_SIZE'],
+                               wait=app.config['ORDER_WRITER_WAIT_MS'] / 1000,
+                               queue_size=app.config['ORDER_WRITER_QUEUE_SIZE'],
+                               timeout=app.config['ORDER_WRITER_TIMEOUT'])
+    pages = PageCache(app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_TTL'])
+    chat_limiter = create_rate_limiter(app.config['CHAT_RATE_LIMIT'] / 60, app.config['CHAT_RATE_BURST'],
+                                       shared=app.config['CHAT_RATE_LIMIT_SHARED'],
+                                       database=app.config['DATABASE'])
+    chat_gate = ConcurrencyGate(app.config['CHAT_MAX_CONCURRENT'])
+    recommender.configure(app.config['DATABASE'], app.config['RECOMMENDATIONS_INDEX'])
+    app.extensions['shop'] = Services(chatbot, cart_store, nlp_worker, order_writer, pages,
+                                      chat_limiter, chat_gate)
+
+    app.register_blueprint(shop)
+    api.init_app(app)
+
+    # Prometheus metrics at /metrics
+    metrics.init_app(app)
+    metrics.register_stats('catalog_cache', 'Product catalog cache statistics.', catalog.stats)
+    metrics.register_stats('chat_intent_cache', 'Chat intent cache statistics.', chatbot.intent_cache.stats)
+    if hasattr(cart_store, 'stats'):
+        metrics.register_stats('cart_cache', 'Cart cache statistics.', cart_store.stats)
+    metrics.register_stats('recommendations', 'Recommendation index statistics.', recommender.stats)
+    metrics.register_stats('nlp_worker', 'NLP worker queue.', lambda: {'queue_depth': nlp_worker.queue_depth()})
+    metrics.register_stats('order_writer', 'Order writer queue and throughput.', lambda: {
+        'queue_depth': order_writer.queue_depth(),
+        'batches': order_writer.batches,
+        'orders': order_writer.orders,
+    })
+    metrics.register_stats('page_cache', 'Rendered page cache statistics.', pages.stats)
+    metrics.register_stats('chat_rate_limit', 'Chat messages allowed and rate limited.', chat_limiter.stats)
+    metrics.register_stats('chat_gate', 'Chat messages shed at the concurrency limit.', chat_gate.stats)
+
+    # Hashed, precompressed static files once `flask build-assets` has run
+    assets.Assets(app)
+
+    if app.config['ORDER_SWEEP_INTERVAL'] > 0:
+        OrderStatusSweeper(app.config['DATABASE'], app.config['ORDER_SWEEP_INTERVAL']).start()
+
+    if app.config['PROXY_FIX_X_FOR'] > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    return app
+
+def too_busy(message, status, retry_after):
+    """A chat reply turning the message away, telling the client when to try again"""
+    response = jsonify({"response": message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+@shop.route('/chatbot', methods=['POST'])
 def chatbot_endpoint():
-    data = request.get_json()
-    user_message = data.get("message", "").lower()
-    
     user_id = session.get('user_id')
     
-    response = chatbot.process_message(user_message, user_id, session)
-    result = {"response": response}
-    
-    if "add to cart" in user_message or "added to your cart" in response:
-        words = user_message.split()
-        product_name = " ".join(words[words.index("add") + 2:])
-        
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
-        c.execute('SELECT id FROM products WHERE name LIKE ?', (f'%{product_name}%',))
-        product = c.fetchone()
-        conn.close()
-        
-        if product and user_id:
-            product_id = product[0]
-            if 'cart' not in session:
-                session['cart'] = {}
-            
-            cart = session['cart']
-            if str(product_id) in cart:
-                cart[str(product_id)] += 1
-            else:
-                cart[str(product_id)] = 1
-            
-            session['cart'] = cart
-            result["response"] = f"{product_name} added to your cart."
-            
-            if "proceed to checkout" in user_message:
-                result["redirect"] = url_for('checkout')
-    
-    elif "place order" in user_message or "checkout" in user_message:
-        cart = session.get('cart', {})
-        if user_id and cart:
-            result["redirect"] = url_for('checkout')
-            result["response"] = "Taking you to checkout to complete your order."
-        else:
-            result["response"] = "Your cart is empty. Add products before checking out."
+    # Checked before any parsing: a client over its limit costs as little as possible
+    wait = chat_limiter.acquire(f"user:{user_id}" if user_id else f"ip:{request.remote_addr}")
+    if wait:
+        return too_busy("You're sending messages too quickly. Please wait a moment and try again.", 429, wait)
     
-    elif "cancel order" in user_message:
-        words = user_message.replace("#", "").split()
-        order_id = next((word for word in words if word.isdigit()), None)
-
-        if order_id and user_id:
-            conn = sqlite3.connect('ecommerce.db')
-            c = conn.cursor()
-
-            c.execute('SELECT id FROM orders WHERE id = ? AND user_id = ?', (order_id, user_id))
-            existing_order = c.fetchone()
-
-            if existing_order:
-                c.execute('UPDATE orders SET status = ? WHERE id = ? AND user_id = ?', 
-                         ('cancelled', order_id, user_id))
-                conn.commit()
-                result["response"] = f"Order #{order_id} has been cancelled."
-            else:
-                result["response"] = f"Order #{order_id} not found or already cancelled."
-
-            conn.close()
+    data = request.get_json()
+    user_message = data.get("message", "").lower()
     
-    elif "view cart" in user_message:
-        if user_id:
-            result["redirect"] = url_for('cart')
-            result["response"] = "Taking you to your cart."
+    retry_after = current_app.config['CHAT_RETRY_AFTER']
+    if not chat_gate.enter():
+        return too_busy("I'm getting a lot of messages right now. Please try again in a moment.", 503, retry_after)
+    try:
+        # One pass over the message decides the reply and what to do about it
+        action = chatbot.process_message(user_message, user_id)
+    except NLPUnavailable:
+        return too_busy("I'm getting a lot of messages right now. Please try again in a moment.", 503, retry_after)
+    finally:
+        chat_gate.leave()
     
-    elif "track order" in user_message:
-        order_id = chatbot.extract_order_id(user_message)
-        if order_id and user_id:
-            # Update the order status before fetching it
-            update_order_status(order_id, user_id)
-            order = chatbot.get_order_status(order_id, user_id)
-            if order:
-                result["response"] = f"Your order #{order_id} is currently {order[1]}. The total amount is ₹{order[3]}. Items: {order[4]}"
-            else:
-                result["response"] = f"I couldn't find order #{order_id}. Please check the order number and try again."
-        else:
-            result["response"] = "Please provide your order ID so I can track it for you."
+    result = {"response": chatbot.execute(action, user_id)}
+    if action.redirect:
+        result["redirect"] = url_for(f"shop.{action.redirect}")
     
     return jsonify(result)
 
-# Database initialization
-def init_db():
-    conn = sqlite3.connect('ecommerce.db')
+# Database initialization: once per deploy, not in every worker
+def init_db(database=None):
+    with db.connection(database) as conn:
+        migrations.migrate(conn)
+        seed_products(conn)
+
+
+def seed_products(conn):
+    """Insert some sample products into an empty catalog"""
     c = conn.cursor()
-    
-    # Users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            username TEXT NOT NULL,
-            password TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Products table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        description TEXT NOT NULL,
-        price REAL NOT NULL,
-        image TEXT NOT NULL
-    )
-''')
-    
-    # Orders table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS orders (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        total_amount DECIMAL(10, 2) NOT NULL,
-        status TEXT NOT NULL,
-        shipping_address TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-''')
-    
-    # Order items table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS order_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            price_at_time DECIMAL(10, 2) NOT NULL,
-            FOREIGN KEY (order_id) REFERENCES orders (id),
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-    ''')
-    
-    # Insert some sample products
     c.execute('SELECT COUNT(*) FROM products')
     if c.fetchone()[0] == 0:
         sample_products = [
@@ -169,173 +253,154 @@ def init_db():
         ]
         c.executemany('INSERT INTO products (name, description, price, image) VALUES (?, ?, ?, ?)', 
               sample_products)
-
-    
-    conn.commit()
-    conn.close()
-
-# Initialize database on startup
-init_db()
+        conn.commit()
+        catalog.invalidate()
+
+@shop.cli.command('sweep-orders')
+def sweep_orders_command():
+    """Mark pending orders older than 24 hours as delivered"""
+    with db.connection() as conn:
+        print(f'Marked {sweep_delivered(conn)} orders as delivered.')
+
+@shop.cli.command('backfill-order-summaries')
+def backfill_order_summaries_command():
+    """Store the item list of orders placed before order summaries existed"""
+    with db.connection() as conn:
+        print(f'Filled in {backfill_summaries(conn)} order summaries.')
+
+@shop.cli.command('init-db')
+def init_db_command():
+    """Apply pending migrations and add the sample products"""
+    init_db()
+    print('Initialized the database.')
+
+@shop.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static/ into static/dist"""
+    manifest = assets.build(current_app.static_folder)
+    print(f"Built {len(manifest['files'])} static files.")
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-@app.route('/')
+@shop.route('/')
 def home():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('shop.login'))
     
-    conn = sqlite3.connect('ecommerce.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM products')
-    products = c.fetchall()
-    conn.close()
+    products = catalog.all()
+    # Every logged-in user sees the same grid
+    return cached_page(pages, ('home', catalog.version),
+                       lambda: (render_template('index.html', products=products), None))
+
+@shop.route('/search')
+def search_products():
+    if 'user_id' not in session:
+        return redirect(url_for('shop.login'))
+    
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    products = search.search_products(get_db(), query, limit) if query else []
+    
+    if request.args.get('format') == 'json':
+        return jsonify([{'id': p[0], 'name': p[1], 'description': p[2], 'price': p[3], 'image': p[4]}
+                        for p in products])
     
-    return render_template('index.html', products=products)
+    return render_template('index.html', products=products, query=query)
 
-@app.route('/login', methods=['GET', 'POST'])
+@shop.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form['email']
         password = hash_password(request.form['password'])
         
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
+        c = get_db().cursor()
         c.execute('SELECT id, email FROM users WHERE email = ? AND password = ?', 
                  (email, password))
         user = c.fetchone()
-        conn.close()
         
         if user:
             session['user_id'] = user[0]
             session['email'] = user[1]
-            return redirect(url_for('home'))
+            return redirect(url_for('shop.home'))
         else:
             flash('Invalid email or password')
     
     return render_template('login.html')
 
-@app.route('/signup', methods=['GET', 'POST'])
+@shop.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
         email = request.form['email']
         username = request.form['username']
         password = hash_password(request.form['password'])
         
-        conn = sqlite3.connect('ecommerce.db')
+        conn = get_db()
         c = conn.cursor()
         try:
             c.execute('INSERT INTO users (email, username, password) VALUES (?, ?, ?)',
                      (email, username, password))
             conn.commit()
-            conn.close()
             flash('Account created successfully! Please login.')
-            return redirect(url_for('login'))
+            return redirect(url_for('shop.login'))
         except sqlite3.IntegrityError:
-            conn.close()
+            conn.rollback()
             flash('Email already exists')
         
     return render_template('signup.html')
 
-@app.route('/logout')
+@shop.route('/logout')
 def logout():
     session.clear()
-    return redirect(url_for('login'))
+    return redirect(url_for('shop.login'))
 
-@app.route('/add_to_cart/<int:product_id>')
+@shop.route('/add_to_cart/<int:product_id>')
 def add_to_cart(product_id):
     if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    cart = session['cart']
-    if str(product_id) in cart:
-        cart[str(product_id)] += 1
-    else:
-        cart[str(product_id)] = 1
+        return redirect(url_for('shop.login'))
     
-    session['cart'] = cart
+    cart_store.add(session['user_id'], product_id)
     return 'Product added to cart', 200
 
-@app.route('/cart')
+@shop.route('/cart')
 def cart():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    if 'cart' not in session:
-        session['cart'] = {}
+        return redirect(url_for('shop.login'))
     
-    cart_items = []
-    total = 0
-    
-    if session['cart']:
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
-        for product_id, quantity in session['cart'].items():
-            c.execute('SELECT * FROM products WHERE id = ?', (product_id,))
-            product = c.fetchone()
-            if product:
-                subtotal = product[3] * quantity
-                cart_items.append({
-                    'id': product[0],
-                    'name': product[1],
-                    'price': product[3],
-                    'quantity': quantity,
-                    'subtotal': subtotal
-                })
-                total += subtotal
-        conn.close()
+    cart_items, total = price_cart(cart_store.get(session['user_id']), catalog.products_by_id())
     
     return render_template('cart.html', cart_items=cart_items, total=total)
 
-@app.route('/update_cart', methods=['POST'])
+@shop.route('/update_cart', methods=['POST'])
 def update_cart():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('shop.login'))
     
-    product_id = request.form['product_id']
+    product_id = request.form.get('product_id', type=int)
     action = request.form['action']
     
-    cart = session.get('cart', {})
-    
-    if action == 'increase':
-        cart[product_id] = cart.get(product_id, 0) + 1
-    elif action == 'decrease':
-        if cart.get(product_id, 0) > 1:
-            cart[product_id] -= 1
-        else:
-            cart.pop(product_id, None)
+    if product_id is not None:
+        if action == 'increase':
+            cart_store.add(session['user_id'], product_id)
+        elif action == 'decrease':
+            cart_store.add(session['user_id'], product_id, -1)
     
-    session['cart'] = cart
-    return redirect(url_for('cart'))
+    return redirect(url_for('shop.cart'))
 
-@app.route('/checkout', methods=['GET', 'POST'])
+@shop.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('shop.login'))
 
     if request.method == 'POST':
+        user_id = session['user_id']
+        idempotency_key = request.form.get('idempotency_key') or None
         try:
-            conn = sqlite3.connect('ecommerce.db')
-            c = conn.cursor()
-
-            # 1. Save address if requested
+            # 1. Keep the address if requested; saved with the order
+            saved_address = None
             if 'save_address' in request.form:
-                c.execute('''
-                    INSERT INTO user_addresses 
-                    (user_id, full_name, street, city, state, zip_code, phone)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    session['user_id'],
-                    request.form['full_name'],
-                    request.form['street'],
-                    request.form['city'],
-                    request.form['state'],
-                    request.form['zip_code'],
-                    request.form['phone']
-                ))
+                saved_address = tuple(request.form[field] for field in
+                                      ('full_name', 'street', 'city', 'state', 'zip_code', 'phone'))
 
             # 2. Create shipping address string
             shipping_address = (
@@ -343,175 +408,121 @@ def checkout():
                 f"{request.form['city']}, {request.form['state']} {request.form['zip_code']}"
             )
 
-            # 3. Calculate total (same as before)
-            total = 0
-            cart_items = []
-            for product_id, quantity in session['cart'].items():
-                c.execute('SELECT price FROM products WHERE id = ?', (product_id,))
-                price = c.fetchone()[0]
-                total += price * quantity
-
-            # 4. Create order with address
-            c.execute('''
-                INSERT INTO orders 
-                (user_id, total_amount, status, shipping_address)
-                VALUES (?, ?, ?, ?)
-            ''', (session['user_id'], total, 'pending', shipping_address))
-            order_id = c.lastrowid
-
-            # 5. Add order items (same as before)
-            for product_id, quantity in session['cart'].items():
-                c.execute('SELECT price FROM products WHERE id = ?', (product_id,))
-                price = c.fetchone()[0]
-                c.execute('''
-                    INSERT INTO order_items 
-                    (order_id, product_id, quantity, price_at_time)
-                    VALUES (?, ?, ?, ?)
-                ''', (order_id, product_id, quantity, price))
-
-            conn.commit()
-            session.pop('cart', None)
-            return redirect(url_for('order_confirmation', order_id=order_id))
-
+            # 3. Price every cart line with a single query, at current prices
+            conn = get_db()
+            cart = cart_store.get(user_id)
+            cart_items, total = price_cart(cart, fetch_products(conn, cart))
+            if not cart_items:
+                # A resubmitted form whose order went through already emptied the cart
+                order_id = find_order(conn, user_id, idempotency_key)
+                if order_id:
+                    return redirect(url_for('shop.order_confirmation', order_id=order_id))
+                flash('Your cart is empty')
+                return redirect(url_for('shop.cart'))
+
+            # 4. Queue the order, its items and the address for the order writer
+            order_id = order_writer.place(Order(user_id, cart_items, total, shipping_address,
+                                                idempotency_key, saved_address))
+
+            # Only the lines just ordered: anything added meanwhile stays in the cart
+            cart_store.clear(user_id, ordered=cart)
+            recommender.record_order(item['id'] for item in cart_items)
+            return redirect(url_for('shop.order_confirmation', order_id=order_id))
+
+        # The order may still be committed after a timeout, so the form comes back with the
+        # same idempotency key: resubmitting it finds that order instead of placing another
+        except OrderWriterBusy:
+            flash("We're taking a lot of orders right now. Please try again in a moment.")
+            return render_template('checkout.html', idempotency_key=idempotency_key, form=request.form), 503
         except Exception as e:
-            conn.rollback()
             flash(f"Checkout error: {str(e)}")
-            return redirect(url_for('checkout'))
-        finally:
-            conn.close()
+            return render_template('checkout.html', idempotency_key=idempotency_key, form=request.form)
 
-    return render_template('checkout.html')
+    # A fresh key per form, so submitting the same form twice places one order
+    return render_template('checkout.html', idempotency_key=uuid.uuid4().hex, form={})
 
-@app.route('/order_confirmation/<int:order_id>')
+@shop.route('/order_confirmation/<int:order_id>')
 def order_confirmation(order_id):
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('shop.login'))
 
-    try:
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
+    user_id = session['user_id']
 
-        c.execute('''
-            SELECT o.id, o.total_amount, o.status, o.shipping_address, o.created_at,
-                   GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')') as items
-            FROM orders o
-            JOIN order_items oi ON o.id = oi.order_id
-            JOIN products p ON oi.product_id = p.id
-            WHERE o.id = ? AND o.user_id = ?
-            GROUP BY o.id
-        ''', (order_id, session['user_id']))
-
-        order = c.fetchone()
+    def render():
+        order = fetch_order(get_db(), order_id, user_id)
         if not order:
             flash('Order not found')
-            return redirect(url_for('home'))
+            return redirect(url_for('shop.home'))
 
-        return render_template('order_confirmation.html', 
+        html = render_template('order_confirmation.html', 
                             order_id=order[0],
                             total=order[1],
                             status=order[2],
                             shipping_address=order[3],
                             order_date=order[4],
                             items=order[5])
+        # A pending order's page changes when it starts showing as delivered
+        return html, delivered_at(order[4]) if order[2] == 'pending' else None
+
+    try:
+        return cached_page(pages, ('order', user_id, order_id, order_versions.get(user_id)), render)
 
     except Exception as e:
         print(f"Confirmation error: {str(e)}")
         flash('Error loading order details')
-        return redirect(url_for('home'))
-    finally:
-        conn.close()
+        return redirect(url_for('shop.home'))
 
-@app.route('/orders')
+@shop.route('/orders')
 def orders():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    conn = sqlite3.connect('ecommerce.db')
-    c = conn.cursor()
-    
-    # Fetch orders for the logged-in user
-    c.execute('''
-        SELECT o.id, o.total_amount, o.status, o.created_at,
-               GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')') as items
-        FROM orders o
-        JOIN order_items oi ON o.id = oi.order_id
-        JOIN products p ON oi.product_id = p.id
-        WHERE o.user_id = ?
-        GROUP BY o.id
-        ORDER BY o.created_at DESC
-    ''', (session['user_id'],))
+        return redirect(url_for('shop.login'))
     
-    orders = c.fetchall()
-    conn.close()
+    user_id = session['user_id']
+    cursor = request.args.get('cursor')
+
+    def render():
+        # Fetch one page of orders for the logged-in user, with statuses as of now
+        orders, next_cursor = fetch_order_page(get_db(), user_id,
+                                               current_app.config['ORDERS_PAGE_SIZE'], cursor)
+        html = render_template('orders.html', orders=orders, next_cursor=next_cursor)
+        # Re-render when the first pending order on the page starts showing as delivered
+        changes = [delivered_at(order[3]) for order in orders if order[2] == 'pending']
+        return html, min(changes, default=None)
+
+    return cached_page(pages, ('orders', user_id, order_versions.get(user_id), cursor), render)
+
+@shop.route('/orders/page')
+def orders_page():
+    """Next page of order history as JSON, for "load more" on the orders page"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Please log in."}), 401
     
-    # Update the status of each order if 24 hours have passed
-    for order in orders:
-        update_order_status(order[0], session['user_id'])
+    orders, next_cursor = fetch_order_page(get_db(), session['user_id'],
+                                           current_app.config['ORDERS_PAGE_SIZE'],
+                                           request.args.get('cursor'))
     
-    return render_template('orders.html', orders=orders)
+    return jsonify({
+        "orders": [{"id": o[0], "total": o[1], "status": o[2], "created_at": o[3], "items": o[4]}
+                   for o in orders],
+        "next_cursor": next_cursor
+    })
 
-@app.route('/cancel_order/<int:order_id>')
+@shop.route('/cancel_order/<int:order_id>')
 def cancel_order(order_id):
     if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    conn = sqlite3.connect('ecommerce.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        SELECT created_at 
-        FROM orders 
-        WHERE id = ? AND user_id = ?
-    ''', (order_id, session['user_id']))
-    
-    order = c.fetchone()
+        return redirect(url_for('shop.login'))
     
-    if order:
-        order_date = datetime.strptime(order[0], '%Y-%m-%d %H:%M:%S')
-        if datetime.now() - order_date < timedelta(hours=24):
-            c.execute('UPDATE orders SET status = ? WHERE id = ?', 
-                     ('cancelled', order_id))
-            conn.commit()
-            flash('Order canceled, your money will be refunded.')
-        else:
-            flash('Product has been shipped, cannot cancel.')
+    conn = get_db()
+    if transition(conn, [order_id], 'cancelled', session['user_id']):
+        flash('Order canceled, your money will be refunded.')
+    else:
+        flash(refusal(conn, order_id, session['user_id'], 'cancelled'))
     
-    conn.close()
-    return redirect(url_for('orders'))
-
+    return redirect(url_for('shop.orders'))
 
-def update_order_status(order_id, user_id):
-    """Update order status to 'delivered' if 24 hours have passed since creation"""
-    conn = sqlite3.connect('ecommerce.db')
-    c = conn.cursor()
-    
-    # Fetch the order creation time and current status
-    c.execute('''
-        SELECT created_at, status
-        FROM orders
-        WHERE id = ? AND user_id = ?
-    ''', (order_id, user_id))
-    
-    order = c.fetchone()
-    if not order:
-        return False  # Order not found
-    
-    created_at_str, status = order
-    created_at = datetime.strptime(created_at_str, '%Y-%m-%d %H:%M:%S')
-    
-    # If 24 hours have passed and status is still 'pending', update to 'delivered'
-    if status == 'pending' and datetime.now() - created_at >= timedelta(hours=24):
-        c.execute('''
-            UPDATE orders
-            SET status = 'delivered'
-            WHERE id = ? AND user_id = ?
-        ''', (order_id, user_id))
-        conn.commit()
-        conn.close()
-        return True  # Status updated
-    
-    conn.close()
-    return False  # Status not updated
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server; production runs wsgi.py under gunicorn
+    app = create_app()
+    init_db(app.config['DATABASE'])
+    app.run(debug=True)
@@ -0,0 +1,238 @@
+"""Fingerprinted, precompressed static assets and responsive product images.
+
+Build once per deploy, after any change under static/:
+
+    python assets.py [--static static]    (or: flask build-assets)
+
+Every file under static/ is copied to static/dist/ with a content hash in its
+name (style.css -> style.3f2a9c01b7e4.css), and CSS is minified. Text files
+get .gz and, when the brotli package is installed, .br siblings. When Pillow
+is installed, each image under images/ also gets WebP and AVIF copies at
+IMAGE_WIDTHS. Everything is listed in static/dist/manifest.json.
+
+Assets(app) reads the manifest: url_for('static', filename=...) then resolves
+to the hashed copy, which is served with the best precompressed variant the
+client accepts and an immutable Cache-Control header. Without a manifest the
+app serves static/ as before.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+from urllib.parse import quote
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:  # Responsive image variants are skipped
+    Image = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+RESIZABLE = {'.png', '.jpg', '.jpeg'}
+# Widths of the product image variants, in CSS pixels
+IMAGE_WIDTHS = (160, 320, 640)
+# Format -> Pillow save options
+IMAGE_FORMATS = {'avif': {'quality': 50}, 'webp': {'quality': 80, 'method': 6}}
+
+# Hashed files never change, so clients may keep them for a year
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(path, data, suffix=''):
+    """images/idli.png -> images/idli<suffix>.<hash>.png"""
+    stem, ext = os.path.splitext(path)
+    return f'{stem}{suffix}.{fingerprint(data)}{ext}'
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    # Not around ':', where 'a :hover' and 'a:hover' are different selectors
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _compress(path, data):
+    # mtime=0 keeps the .gz bytes the same from build to build
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11))
+
+
+def _image_formats():
+    if Image is None:
+        return []
+    return [name for name in IMAGE_FORMATS if features.check(name)]
+
+
+def _resize(source, out_dir, name, formats):
+    """Write each format at each width no wider than the original; returns {format: [(width, name)]}"""
+    variants = {}
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        stem = os.path.splitext(name)[0]
+        widths = [width for width in IMAGE_WIDTHS if width < image.width] + [image.width]
+        for width in sorted(set(widths)):
+            resized = image if width == image.width else image.resize(
+                (width, round(image.height * width / image.width)), Image.LANCZOS)
+            for format in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, format.upper(), **IMAGE_FORMATS[format])
+                data = buffer.getvalue()
+                variant = hashed_name(f'{stem}.{format}', data, f'.{width}w')
+                _write(os.path.join(out_dir, variant), data)
+                variants.setdefault(format, []).append((width, variant))
+    return variants
+
+
+def build(static_folder):
+    """Rebuild static_folder/dist; returns the manifest"""
+    out_dir = os.path.join(static_folder, DIST)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    formats = _image_formats()
+    manifest = {'files': {}, 'images': {}}
+
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != out_dir)
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1].lower()
+            with open(source, 'rb') as f:
+                data = f.read()
+            if ext == '.css':
+                data = minify_css(data.decode()).encode()
+
+            hashed = hashed_name(name, data)
+            _write(os.path.join(out_dir, hashed), data)
+            if ext in COMPRESSIBLE:
+                _compress(os.path.join(out_dir, hashed), data)
+            manifest['files'][name] = hashed
+            if ext in RESIZABLE and formats and name.startswith('images/'):
+                manifest['images'][name] = _resize(source, out_dir, name, formats)
+
+    _write(os.path.join(out_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+class Assets:
+    """The build manifest, as used by templates and the static view"""
+
+    def __init__(self, app=None):
+        self.files = {}
+        self.images = {}
+        self.hashed = set()
+        if app is not None:
+            self.init_app(app)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        self.files = manifest.get('files', {})
+        self.images = manifest.get('images', {})
+        self.hashed = set(self.files.values())
+        for variants in self.images.values():
+            self.hashed.update(name for widths in variants.values() for _, name in widths)
+
+    def _dist_url(self, hashed):
+        # Quoted: srcset would split 'badam milk.png' at the space
+        return quote(f'{self.static_url_path}/{DIST}/{hashed}')
+
+    def _filename(self, src):
+        """'/static/images/idli.png' -> 'images/idli.png'"""
+        prefix = self.static_url_path + '/'
+        return src[len(prefix):] if src and src.startswith(prefix) else src
+
+    def image_src(self, src):
+        """A product image's src, hashed when it was built"""
+        filename = self._filename(src)
+        return self._dist_url(self.files[filename]) if filename in self.files else src
+
+    def image_sources(self, src):
+        """[(mime type, srcset)] for a product image, best format first"""
+        variants = self.images.get(self._filename(src), {})
+        return [(f'image/{format}',
+                 ', '.join(f'{self._dist_url(name)} {width}w' for width, name in variants[format]))
+                for format in IMAGE_FORMATS if format in variants]
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_MANIFEST', os.path.join(app.static_folder, DIST, MANIFEST))
+        self.static_url_path = app.static_url_path
+        self.load(app.config['ASSETS_MANIFEST'])
+        app.jinja_env.globals.update(image_src=self.image_src, image_sources=self.image_sources)
+
+        @app.url_defaults
+        def hashed_static(endpoint, values):
+            if endpoint == 'static' and values.get('filename') in self.files:
+                values['filename'] = f"{DIST}/{self.files[values['filename']]}"
+
+        static_view = app.view_functions['static']
+
+        def static(filename):
+            if not filename.startswith(DIST + '/') or filename[len(DIST) + 1:] not in self.hashed:
+                return static_view(filename=filename)
+            return self.send_hashed(app.static_folder, filename)
+
+        app.view_functions['static'] = static
+
+    def send_hashed(self, static_folder, filename):
+        """Send a hashed file, precompressed when the client accepts it"""
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if accepted[encoding] and os.path.isfile(os.path.join(static_folder, filename + suffix)):
+                # The mimetype comes from the original name, not the .gz/.br
+                response = send_from_directory(static_folder, filename + suffix, conditional=True,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(static_folder, filename, conditional=True)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets.')
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    args = parser.parse_args()
+
+    manifest = build(args.static)
+    variants = sum(len(widths) for formats in manifest['images'].values() for widths in formats.values())
+    print(f"{os.path.join(args.static, DIST)}: {len(manifest['files'])} files, {variants} image variants"
+          f"{'' if brotli else ' (no brotli: .gz only)'}{'' if Image else ' (no Pillow: no image variants)'}")
+
+
+if __name__ == '__main__':
+    main()
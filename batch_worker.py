@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+class BatchWorker:
+    """A bounded queue drained in micro-batches by one background thread.
+
+    Callers submit() an item and wait on the returned future. The thread
+    takes whatever arrived within `wait` seconds of the first item, up to
+    batch_size items, drops those whose callers already gave up, and hands
+    the rest to process() as [(item, future)]. When the queue is full,
+    submit() fails fast with busy_error instead of piling up work.
+
+    Subclasses set the class attributes below and implement process();
+    prepare() runs once on the thread before the first batch.
+    """
+
+    thread_name = 'batch-worker'
+    busy_error = RuntimeError
+    full_message = 'Queue is full'
+    timeout_message = 'Timed out waiting for the worker'
+
+    def __init__(self, batch_size, wait, queue_size, timeout):
+        self.batch_size = batch_size
+        self.wait = wait
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def submit(self, item):
+        self.start()
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            raise self.busy_error(self.full_message)
+        return future
+
+    def result(self, future, timeout=None):
+        """future's result, waiting at most timeout seconds (None: self.timeout)"""
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            # Dropped if the thread has not started on it yet
+            future.cancel()
+            raise self.busy_error(self.timeout_message)
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def prepare(self):
+        pass
+
+    def process(self, batch):
+        raise NotImplementedError
+
+    def _run(self):
+        self.prepare()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Skip items whose callers already gave up
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self.process(batch)
@@ -0,0 +1 @@
+"""Micro-benchmarks and load tests. Run modules from the repository root, e.g. `python -m benchmarks.intent_similarity`."""
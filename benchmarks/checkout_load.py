@@ -0,0 +1,108 @@
+"""Checkout throughput under concurrent load: one write transaction per order
+(the old checkout path) against the group-commit order writer.
+
+    python -m benchmarks.checkout_load [--threads 32] [--orders 100]
+
+Each thread places --orders orders for its own user on a scratch copy of the
+schema; every order has three items and an idempotency key.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+import db
+import migrations
+from order_writer import Order, OrderWriter, insert_order
+
+ITEMS = [
+    {'id': 1, 'name': 'Idli Mix', 'price': 50.0, 'quantity': 2, 'subtotal': 100.0},
+    {'id': 2, 'name': 'Dosa Mix', 'price': 60.0, 'quantity': 1, 'subtotal': 60.0},
+    {'id': 6, 'name': 'Cake Mix', 'price': 120.0, 'quantity': 1, 'subtotal': 120.0},
+]
+
+
+def make_order(user_id):
+    return Order(user_id, ITEMS, 280.0, 'Test User, 1 Main St, Chennai, TN 600001', uuid.uuid4().hex)
+
+
+def place_direct(database, order):
+    """Today's checkout: its own connection and write transaction per order"""
+    with db.connection(database) as conn:
+        try:
+            order_id = insert_order(conn.cursor(), order)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return order_id
+
+
+def run(label, place, threads, orders):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(user_id):
+        mine = []
+        for _ in range(orders):
+            start = time.perf_counter()
+            try:
+                place(make_order(user_id))
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(user_id,)) for user_id in range(1, threads + 1)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    print(f"{label:<14} {len(latencies) / elapsed:>10.0f} {p50:>9.1f} {p99:>9.1f} {len(errors):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--orders', type=int, default=100, help='orders per thread')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--wait-ms', type=float, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.threads} threads x {args.orders} orders")
+        print(f"{'path':<14} {'orders/s':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'errors':>7}")
+
+        database = os.path.join(tmp, 'direct.db')
+        with db.connection(database) as conn:
+            migrations.migrate(conn)
+        db.get_pool(database).max_size = args.threads
+        run('per-request', lambda order: place_direct(database, order), args.threads, args.orders)
+
+        database = os.path.join(tmp, 'writer.db')
+        with db.connection(database) as conn:
+            migrations.migrate(conn)
+        writer = OrderWriter(database, batch_size=args.batch_size, wait=args.wait_ms / 1000)
+        run('order writer', writer.place, args.threads, args.orders)
+        writer.stop()
+        print(f"order writer committed {writer.orders} orders in {writer.batches} transactions")
+
+        db.get_pool(os.path.join(tmp, 'direct.db')).close()
+        db.get_pool(database).close()
+
+
+if __name__ == '__main__':
+    main()
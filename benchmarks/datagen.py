@@ -0,0 +1,148 @@
+"""Fill a database with synthetic users, products and order history for load
+testing.
+
+    python -m benchmarks.datagen --database bench.db [--users 10000]
+        [--products 20000] [--orders 1000000] [--seed 0]
+
+The database is migrated first; rows are appended to whatever is there.
+Every generated user can log in as user<N>@example.com with PASSWORD. The
+same arguments and seed always produce the same rows, with order dates
+relative to when it runs.
+"""
+import argparse
+import hashlib
+import itertools
+import random
+import string
+import time
+from datetime import datetime, timedelta
+
+import db
+import migrations
+import order_history
+
+PASSWORD = 'password'
+EMAIL = 'user{}@example.com'
+
+FLAVOURS = ['idli', 'dosa', 'upma', 'poha', 'pancake', 'cake', 'vanilla', 'strawberry',
+            'thandai', 'badam', 'chutney', 'sambar', 'rasam', 'mango', 'masala', 'ragi']
+FORMS = ['mix', 'premix', 'batter', 'powder', 'instant mix']
+IMAGES = ['idli.png', 'dosa.png', 'upma.png', 'poha.png', 'pan-cake.png', 'cake.png', 'vanila.png',
+          'strawberry.png', 'thandai.png', 'badam milk.png', 'chutney.png', 'sambar.png', 'rasam.png']
+CITIES = ['Chennai', 'Bengaluru', 'Hyderabad', 'Mumbai', 'Pune', 'Delhi', 'Kochi']
+
+# Rows per executemany call, so memory stays flat for millions of rows
+CHUNK = 50000
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_users(conn, count, rng):
+    # Same hashing as app.hash_password
+    password = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    start = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]
+    rows = ((EMAIL.format(n), f'user{n}', password) for n in range(start + 1, start + count + 1))
+    for chunk in _chunks(rows):
+        conn.executemany('INSERT OR IGNORE INTO users (email, username, password) VALUES (?, ?, ?)', chunk)
+    return [row[0] for row in conn.execute('SELECT id FROM users')]
+
+
+def generate_products(conn, count, rng):
+    def rows():
+        for _ in range(count):
+            brand = ''.join(rng.choices(string.ascii_lowercase, k=6)).title()
+            flavour, form = rng.choice(FLAVOURS), rng.choice(FORMS)
+            yield (f'{brand} {flavour.title()} {form.title()}', f'{flavour} {form} by {brand}',
+                   float(rng.randint(20, 500)), f'/static/images/{rng.choice(IMAGES)}')
+
+    for chunk in _chunks(rows()):
+        conn.executemany('INSERT INTO products (name, description, price, image) VALUES (?, ?, ?, ?)', chunk)
+    return conn.execute('SELECT id, price FROM products').fetchall()
+
+
+def generate_orders(conn, count, user_ids, products, rng, days=365):
+    """count orders of 1-5 items over the last `days` days; returns the number of items"""
+    # A long tail: a few products sell far more than the rest
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(products))))
+    now = datetime.now()
+    first_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0] + 1
+    items_written = 0
+
+    for chunk_start in range(0, count, CHUNK):
+        orders, items = [], []
+        for order_id in range(first_id + chunk_start, first_id + min(chunk_start + CHUNK, count)):
+            created_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+            basket = {product_id: price for product_id, price in
+                      rng.choices(products, cum_weights=cum_weights, k=rng.randint(1, 5))}
+            lines = [(order_id, product_id, rng.randint(1, 3), price) for product_id, price in basket.items()]
+            total = sum(quantity * price for _, _, quantity, price in lines)
+            # Old orders were delivered or cancelled; recent ones may still be pending
+            if created_at > now - timedelta(hours=24):
+                status = 'pending'
+            else:
+                status = 'cancelled' if rng.random() < 0.05 else 'delivered'
+            orders.append((order_id, rng.choice(user_ids), total, status,
+                           f'User, 1 Main St, {rng.choice(CITIES)}, TN 600001',
+                           created_at.strftime('%Y-%m-%d %H:%M:%S')))
+            items.extend(lines)
+        conn.executemany('''
+            INSERT INTO orders (id, user_id, total_amount, status, shipping_address, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', orders)
+        conn.executemany('''
+            INSERT INTO order_items (order_id, product_id, quantity, price_at_time)
+            VALUES (?, ?, ?, ?)
+        ''', items)
+        items_written += len(items)
+    return items_written
+
+
+def generate(database, users, products, orders, seed=0):
+    rng = random.Random(seed)
+    with db.connection(database) as conn:
+        migrations.migrate(conn)
+        # A scratch database: trade durability for load speed
+        conn.execute('PRAGMA synchronous=OFF')
+        try:
+            user_ids = generate_users(conn, users, rng)
+            catalog = generate_products(conn, products, rng)
+            items = generate_orders(conn, orders, user_ids, catalog, rng)
+            conn.commit()
+            # Checkout stores each order's item summary; generated orders get theirs here
+            order_history.backfill_summaries(conn, batch_size=10000)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA optimize')
+    return {'users': len(user_ids), 'products': len(catalog), 'orders': orders, 'order_items': items}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.database, args.users, args.products, args.orders, args.seed)
+    print(f"{args.database}: {counts['users']} users, {counts['products']} products, "
+          f"{counts['orders']} orders, {counts['order_items']} order items "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
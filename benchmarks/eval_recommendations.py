@@ -0,0 +1,132 @@
+"""Offline hit-rate@k of the co-purchase recommender, against best-seller and
+random baselines.
+
+    python -m benchmarks.eval_recommendations [--database ecommerce.db] [--k 3]
+
+Each user's latest order is held out; the index is built from every other
+order and a user counts as a hit when any held-out product is among the k
+products recommended from their earlier purchases. Without --database the
+orders are synthetic: shoppers who mostly buy within a few related groups.
+"""
+import argparse
+import random
+import sqlite3
+import time
+
+import db
+from recommendations import HISTORY_SIZE, Recommender
+
+
+def synthetic_orders(users, products, groups, seed=0):
+    """[(order_id, user_id, [product_id, ...])] in the order they were placed"""
+    rng = random.Random(seed)
+    group_of = {product_id: product_id % groups for product_id in range(1, products + 1)}
+    members = {}
+    for product_id, group in group_of.items():
+        members.setdefault(group, []).append(product_id)
+
+    orders = []
+    for user_id in range(1, users + 1):
+        favourites = rng.sample(range(groups), 2)
+        for _ in range(rng.randint(1, 8)):
+            group = rng.choice(favourites) if rng.random() < 0.8 else rng.randrange(groups)
+            basket = rng.sample(members[group], rng.randint(1, 4))
+            orders.append((user_id, basket))
+    rng.shuffle(orders)
+    return [(order_id, user_id, basket) for order_id, (user_id, basket) in enumerate(orders, 1)]
+
+
+def database_orders(path):
+    with db.connection(path) as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT o.id, o.user_id, oi.product_id
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            ORDER BY o.created_at, o.id
+        ''')
+        orders = {}
+        for order_id, user_id, product_id in c.fetchall():
+            orders.setdefault(order_id, (order_id, user_id, []))[2].append(product_id)
+    return list(orders.values())
+
+
+def split(orders):
+    """(training orders, {user_id: held-out products}) holding out each user's latest order"""
+    latest = {}
+    for order in orders:
+        latest[order[1]] = order
+    # Users with a single order have no history to recommend from
+    counts = {}
+    for _, user_id, _ in orders:
+        counts[user_id] = counts.get(user_id, 0) + 1
+    held_out = {user_id: set(order[2]) for user_id, order in latest.items() if counts[user_id] > 1}
+    test_orders = {latest[user_id][0] for user_id in held_out}
+    return [order for order in orders if order[0] not in test_orders], held_out
+
+
+def build_index(training):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE order_items (order_id INTEGER, product_id INTEGER)')
+    conn.executemany('INSERT INTO order_items VALUES (?, ?)',
+                     [(order_id, product_id) for order_id, _, basket in training for product_id in basket])
+    index = Recommender(max_age=0)
+    index.build(conn)
+    return index
+
+
+def hit_rate(recommend, histories, held_out, k):
+    hits = sum(1 for user_id, products in held_out.items()
+               if products & set(recommend(histories.get(user_id, []), k)))
+    return hits / len(held_out) if held_out else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='evaluate on the orders in this database')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--groups', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.database:
+        orders = database_orders(args.database)
+    else:
+        orders = synthetic_orders(args.users, args.products, args.groups)
+    training, held_out = split(orders)
+    if not held_out:
+        parser.exit(1, 'No user has more than one order to evaluate on.\n')
+
+    start = time.perf_counter()
+    index = build_index(training)
+    build = time.perf_counter() - start
+
+    # Each user's distinct earlier products, most recent first
+    histories = {}
+    for _, user_id, basket in reversed(training):
+        history = histories.setdefault(user_id, [])
+        for product_id in basket:
+            if product_id not in history and len(history) < HISTORY_SIZE:
+                history.append(product_id)
+
+    products = sorted({product_id for _, _, basket in orders for product_id in basket})
+    rng = random.Random(1)
+    baselines = {
+        'co-purchase': index.recommend_for,
+        'best sellers': lambda history, k: index.best_sellers(k, exclude=set(history)),
+        'random': lambda history, k: rng.sample(products, min(k, len(products))),
+    }
+
+    stats = index.stats()
+    print(f"{len(orders)} orders, {len(held_out)} held-out users; index: {stats['products']} products, "
+          f"{stats['pairs']} pairs, built in {build * 1000:.0f}ms")
+    for label, recommend in baselines.items():
+        start = time.perf_counter()
+        rate = hit_rate(recommend, histories, held_out, args.k)
+        per_user = (time.perf_counter() - start) / len(held_out) * 1e6
+        print(f"{label:<13} hit-rate@{args.k} {rate:6.1%}   {per_user:7.1f}us/user")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Keyword scoring cost per message as the intent tables grow: the original
+`keyword in message.lower()` loop against the single-pass KeywordMatcher.
+
+    python -m benchmarks.intent_matcher [--repeat 2000]
+"""
+import argparse
+import random
+import string
+import time
+
+from intent_matcher import KeywordMatcher
+
+MESSAGES = [
+    "hi",
+    "track my order 41",
+    "add idli mix to cart",
+    "i want to cancel order #12 please",
+    "can you recommend something similar to dosa mix",
+    "thanks, bye",
+]
+
+BASE_INTENTS = {
+    "greeting": ["hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening"],
+    "order_placement": ["order", "buy", "purchase", "add to cart", "checkout", "want to buy", "want to order"],
+    "order_tracking": ["track", "status", "where is", "delivery status", "shipping status", "order status", "my order"],
+    "order_cancellation": ["cancel", "stop", "return", "refund", "don't want"],
+    "product_recommendation": ["recommend", "suggestion", "similar", "like", "suggest", "what else", "more products"],
+    "help": ["help", "support", "assistance", "guide", "how to", "how do I"],
+    "goodbye": ["bye", "goodbye", "see you", "talk to you later", "thanks", "thank you"],
+}
+
+
+def grow_intents(extra_per_intent, seed=0):
+    """The real intents padded with random two-word phrases"""
+    rng = random.Random(seed)
+    intents = {intent: list(keywords) for intent, keywords in BASE_INTENTS.items()}
+    for keywords in intents.values():
+        for _ in range(extra_per_intent):
+            words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8))) for _ in range(2)]
+            keywords.append(' '.join(words))
+    return intents
+
+
+def legacy_scores(intents, message):
+    scores = {}
+    for intent, keywords in intents.items():
+        score = 0
+        for keyword in keywords:
+            if keyword in message.lower():
+                score += 1
+        scores[intent] = score
+    return scores
+
+
+def time_per_message(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in MESSAGES:
+            func(message)
+    return (time.perf_counter() - start) / (repeat * len(MESSAGES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'keywords':>8} {'legacy (us)':>12} {'matcher (us)':>13}")
+    for extra in (0, 20, 100, 500):
+        intents = grow_intents(extra)
+        matcher = KeywordMatcher(intents)
+        legacy = time_per_message(lambda m: legacy_scores(intents, m), args.repeat)
+        current = time_per_message(lambda m: matcher.score(m.lower()), args.repeat)
+        total = sum(len(keywords) for keywords in intents.values())
+        print(f"{total:>8} {legacy * 1e6:>12.1f} {current * 1e6:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Per-message cost of the detect_intent similarity fallback, before and after
+precomputing the keyword vector matrix.
+
+    python -m benchmarks.intent_similarity [--repeat 20]
+"""
+import argparse
+import time
+
+from chatbot import Chatbot
+
+# Messages that match no keyword, so detect_intent always falls back to similarity
+UNKNOWN_MESSAGES = [
+    "qwerty",
+    "i am looking for something tasty",
+    "what do you sell",
+    "is the store open today",
+    "my package never arrived",
+    "can someone call me",
+]
+
+
+def legacy_similar_intent(chatbot, message):
+    """The original fallback: one spaCy pipeline run and one comparison per keyword"""
+    doc = chatbot.nlp(message.lower())
+    max_score = 0
+    detected_intent = "unknown"
+    for intent, keywords in chatbot.intents.items():
+        for keyword in keywords:
+            keyword_doc = chatbot.nlp(keyword)
+            try:
+                similarity = doc.similarity(keyword_doc)
+                if similarity > 0.7 and similarity > max_score:
+                    max_score = similarity
+                    detected_intent = intent
+            except Exception:
+                pass
+    return detected_intent
+
+
+def time_per_message(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in UNKNOWN_MESSAGES:
+            func(message)
+    return (time.perf_counter() - start) / (repeat * len(UNKNOWN_MESSAGES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    chatbot = Chatbot()
+
+    # Both versions must agree before their timings mean anything
+    for message in UNKNOWN_MESSAGES:
+        legacy = legacy_similar_intent(chatbot, message)
+        current = chatbot.similar_intent(message.lower()) or "unknown"
+        if legacy != current:
+            print(f"warning: intents differ for {message!r}: {legacy} vs {current}")
+
+    before = time_per_message(lambda m: legacy_similar_intent(chatbot, m), args.repeat)
+    after = time_per_message(lambda m: chatbot.similar_intent(m.lower()), args.repeat)
+
+    print(f"keywords: {len(chatbot.keyword_index[0])}")
+    print(f"per-keyword spaCy runs: {before * 1000:.3f} ms/message")
+    print(f"precomputed matrix:     {after * 1000:.3f} ms/message")
+    print(f"speedup:                {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""Drive the app through Flask's test client with a scripted shopping and chat
+workload; report throughput, latency percentiles and SQL statements per route.
+
+    python -m benchmarks.load_test --database bench.db [--requests 5000]
+        [--threads 1] [--output report.json] [--compare baseline.json]
+
+Fill the database with benchmarks.datagen first. Virtual users log in as the
+generated users and pick steps from WORKLOAD by weight, with a fixed seed, so
+two runs against the same data issue the same requests. The JSON report
+records the commit it ran on; --compare prints the change in p50/p95 per
+route against an earlier report and exits non-zero when any route's p95 got
+worse by more than --threshold. SQL statements are counted on the request
+thread, so orders committed by the order writer thread are not included.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+CHAT_MESSAGES = [
+    # (weight, message); {product} is a catalog product, {order} one of the user's orders
+    (20, 'hi'),
+    (10, 'help'),
+    (20, 'add {product} to cart'),
+    (15, 'track order {order}'),
+    (10, 'where is my order'),
+    (10, 'recommend something'),
+    (5, 'view cart'),
+    (5, 'checkout'),
+    (5, 'thank you, bye'),
+]
+
+_local = threading.local()
+
+
+def _count_statement(statement):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class VirtualUser:
+    """One logged-in shopper with their own session cookie"""
+
+    def __init__(self, client, email, products, rng):
+        self.client = client
+        self.products = products
+        self.rng = rng
+        self.cart = []
+        self.orders = []
+        response = client.post('/login', data={'email': email, 'password': 'password'})
+        if response.status_code != 302:
+            raise RuntimeError(f'Could not log in as {email}')
+
+    def home(self):
+        return self.client.get('/')
+
+    def add_to_cart(self):
+        product_id = self.rng.choice(self.products)[0]
+        self.cart.append(product_id)
+        return self.client.get(f'/add_to_cart/{product_id}')
+
+    def cart_page(self):
+        return self.client.get('/cart')
+
+    def update_cart(self):
+        if not self.cart:
+            return self.add_to_cart()
+        action = self.rng.choice(['increase', 'decrease'])
+        return self.client.post('/update_cart', data={'product_id': self.rng.choice(self.cart),
+                                                      'action': action})
+
+    def checkout_form(self):
+        return self.client.get('/checkout')
+
+    def checkout(self):
+        if not self.cart:
+            self.add_to_cart()
+        form = self.client.get('/checkout').get_data(as_text=True)
+        key = re.search(r'name="idempotency_key" value="(\w+)"', form)
+        response = self.client.post('/checkout', data={
+            'full_name': 'Load Test', 'street': '1 Main St', 'city': 'Chennai', 'state': 'TN',
+            'zip_code': '600001', 'phone': '9999999999', 'idempotency_key': key.group(1) if key else '',
+        })
+        confirmed = re.search(r'/order_confirmation/(\d+)', response.headers.get('Location', ''))
+        if confirmed:
+            self.orders.append(confirmed.group(1))
+            self.cart = []
+        return response
+
+    def orders_page(self):
+        return self.client.get('/orders')
+
+    def chat(self):
+        weights, messages = zip(*CHAT_MESSAGES)
+        message = self.rng.choices(messages, weights=weights)[0].format(
+            product=self.rng.choice(self.products)[1].lower(),
+            order=self.rng.choice(self.orders) if self.orders else self.rng.randint(1, 1000))
+        return self.client.post('/chatbot', json={'message': message})
+
+
+# (route, weight, step)
+WORKLOAD = [
+    ('/', 20, VirtualUser.home),
+    ('/add_to_cart', 12, VirtualUser.add_to_cart),
+    ('/cart', 12, VirtualUser.cart_page),
+    ('/update_cart', 8, VirtualUser.update_cart),
+    ('/checkout (form)', 4, VirtualUser.checkout_form),
+    ('/checkout', 4, VirtualUser.checkout),  # Fetches the form for its idempotency key, then submits it
+    ('/orders', 15, VirtualUser.orders_page),
+    ('/chatbot', 25, VirtualUser.chat),
+]
+
+
+def run_workload(users, requests, rng):
+    """Issue requests steps round-robin across users; returns ([(route, seconds, queries)], {route: errors})"""
+    samples, errors = [], {}
+    routes, weights, steps = zip(*WORKLOAD)
+
+    for n in range(requests):
+        user = users[n % len(users)]
+        index = rng.choices(range(len(WORKLOAD)), weights=weights)[0]
+        _local.queries = 0
+        start = time.perf_counter()
+        try:
+            response = steps[index](user)
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - start
+        samples.append((routes[index], elapsed, _local.queries))
+        if failed:
+            errors[routes[index]] = errors.get(routes[index], 0) + 1
+    return samples, errors
+
+
+def summarize(samples, errors, elapsed):
+    by_route = {}
+    for route, seconds, queries in samples:
+        by_route.setdefault(route, []).append((seconds, queries))
+
+    routes = {}
+    for route, measurements in sorted(by_route.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in measurements)
+        routes[route] = {
+            'requests': len(measurements),
+            'errors': errors.get(route, 0),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'max_ms': round(latencies[-1], 3),
+            'queries_per_request': round(sum(queries for _, queries in measurements) / len(measurements), 2),
+        }
+
+    latencies = sorted(seconds * 1000 for _, seconds, _ in samples)
+    return {
+        'total': {
+            'requests': len(samples),
+            'errors': sum(errors.values()),
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+        },
+        'routes': routes,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset(database):
+    conn = sqlite3.connect(database)
+    try:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('users', 'products', 'orders', 'order_items')}
+    finally:
+        conn.close()
+
+
+def print_report(report):
+    total = report['total']
+    print(f"{total['requests']} requests in {total['seconds']:.1f}s: {total['requests_per_second']:.0f} req/s, "
+          f"p50 {total['p50_ms']:.1f}ms, p95 {total['p95_ms']:.1f}ms, p99 {total['p99_ms']:.1f}ms, "
+          f"{total['errors']} errors")
+    print(f"{'route':<17} {'reqs':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+    for route, stats in report['routes'].items():
+        print(f"{route:<17} {stats['requests']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+              f"{stats['p99_ms']:>8.2f} {stats['queries_per_request']:>8.1f} {stats['errors']:>7}")
+
+
+def compare(baseline, report, threshold):
+    """Print per-route changes against baseline; returns the routes whose p95 regressed"""
+    print(f"\nagainst {baseline['meta'].get('commit') or 'baseline'}:")
+    print(f"{'route':<17} {'p50 ms':>17} {'p95 ms':>17} {'queries':>13}")
+    regressed = []
+    for route, new in report['routes'].items():
+        old = baseline['routes'].get(route)
+        if not old:
+            continue
+        change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        if change > threshold:
+            regressed.append(route)
+        print(f"{route:<17} {old['p50_ms']:>7.2f} -> {new['p50_ms']:>6.2f} "
+              f"{old['p95_ms']:>7.2f} -> {new['p95_ms']:>6.2f} "
+              f"{old['queries_per_request']:>5.1f} -> {new['queries_per_request']:>4.1f}"
+              f"{'  REGRESSED' if route in regressed else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='a database filled by benchmarks.datagen')
+    parser.add_argument('--requests', type=int, default=5000, help='measured requests per thread')
+    parser.add_argument('--warmup', type=int, default=200, help='unmeasured requests per thread first')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--users', type=int, default=50, help='virtual users per thread')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='an earlier JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='p95 slowdown that counts as a regression (default 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    # Set before importing db, whose default database comes from the environment
+    os.environ['ECOMMERCE_DB'] = args.database
+    import db
+    db.on_connect(lambda conn: conn.set_trace_callback(_count_statement))
+    from app import create_app
+    app = create_app({'DATABASE': args.database, 'ORDER_SWEEP_INTERVAL': 0})
+    # As wsgi.py does before forking, so no build runs while requests are timed
+    from recommendations import recommender
+    recommender.refresh()
+
+    counts = dataset(args.database)
+    conn = sqlite3.connect(args.database)
+    emails = [row[0] for row in conn.execute(
+        "SELECT email FROM users WHERE email LIKE 'user%@example.com' ORDER BY id LIMIT ?",
+        (args.users * args.threads,))]
+    products = conn.execute('SELECT id, name FROM products ORDER BY id LIMIT 1000').fetchall()
+    conn.close()
+    if len(emails) < args.users * args.threads or not products:
+        parser.exit(1, f'{args.database} needs {args.users * args.threads} generated users and some '
+                       f'products; run python -m benchmarks.datagen first.\n')
+
+    # Every thread logs in and warms up before the clock starts
+    barrier = threading.Barrier(args.threads + 1)
+    results = [None] * args.threads
+
+    def work(n):
+        try:
+            rng = random.Random(args.seed + n)
+            users = [VirtualUser(app.test_client(), email, products, rng)
+                     for email in emails[n * args.users:(n + 1) * args.users]]
+            run_workload(users, args.warmup, rng)
+        except Exception:
+            barrier.abort()
+            raise
+        barrier.wait()
+        results[n] = run_workload(users, args.requests, rng)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        parser.exit(1, 'A load thread failed while warming up.\n')
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples, errors = [], {}
+    for thread_samples, thread_errors in filter(None, results):
+        samples.extend(thread_samples)
+        for route, count in thread_errors.items():
+            errors[route] = errors.get(route, 0) + count
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'database': args.database,
+            'dataset': counts,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'threads': args.threads,
+            'users': args.users,
+            'seed': args.seed,
+        },
+        **summarize(samples, errors, elapsed),
+    }
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), report, args.threshold)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Product lookup latency on a large synthetic catalog: `name LIKE '%...%'`
+against the FTS5 trigram index, including the typo-tolerant fallback.
+
+    python -m benchmarks.product_search [--products 100000] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import string
+import tempfile
+import time
+
+import search
+
+FLAVOURS = ['idli', 'dosa', 'upma', 'poha', 'pancake', 'cake', 'vanilla', 'strawberry',
+            'thandai', 'badam', 'chutney', 'sambar', 'rasam', 'mango', 'masala', 'ragi']
+FORMS = ['mix', 'premix', 'batter', 'powder', 'instant mix']
+
+QUERIES = {
+    'exact word': 'strawberry',
+    'two words': 'masala dosa',
+    'substring': 'berry',
+    'typo': 'strawbery',
+    'no match': 'zzqx',
+}
+
+
+def build_catalog(path, count, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            price REAL NOT NULL,
+            image TEXT NOT NULL
+        )
+    ''')
+    rows = []
+    for _ in range(count):
+        brand = ''.join(rng.choices(string.ascii_lowercase, k=6))
+        name = f"{brand.title()} {rng.choice(FLAVOURS).title()} {rng.choice(FORMS).title()}"
+        rows.append((name, f"{rng.choice(FLAVOURS)} {rng.choice(FORMS)} by {brand}",
+                     rng.randint(20, 500), '/static/images/cake.png'))
+    conn.executemany('INSERT INTO products (name, description, price, image) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    search.create_search_index(conn)
+    conn.commit()
+    return conn
+
+
+def time_query(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        conn = build_catalog(os.path.join(tmp, 'catalog.db'), args.products)
+        print(f"built {args.products} products and index in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'query':<12} {'LIKE (ms)':>10} {'search (ms)':>12}  top result")
+        for label, query in QUERIES.items():
+            like = time_query(lambda: conn.execute(
+                'SELECT * FROM products WHERE name LIKE ?', (f'%{query}%',)).fetchone(), args.repeat)
+            ranked = time_query(lambda: search.search_products(conn, query, limit=10), args.repeat)
+            top = search.best_match(conn, query)
+            print(f"{label:<12} {like * 1000:>10.2f} {ranked * 1000:>12.2f}  {top[1] if top else '-'}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""EXPLAIN QUERY PLAN for the hot read and write paths. Exits non-zero if any
+of them scans orders, order_items, user_addresses or cart_items instead of
+using an index.
+
+    python -m benchmarks.query_plans [--database ecommerce.db]
+
+Run it against a migrated database (python migrations.py).
+"""
+import argparse
+import sys
+
+import db
+import migrations
+from order_status import allowed, effective_status
+
+HOT_QUERIES = {
+    'orders page': (f'''
+        SELECT o.id, o.total_amount, {effective_status()}, o.created_at, o.items_summary
+        FROM orders o
+        WHERE o.user_id = ?
+        ORDER BY o.created_at DESC, o.id DESC
+        LIMIT ?
+    ''', (1, 21)),
+    'orders page after cursor': (f'''
+        SELECT o.id, o.total_amount, {effective_status()}, o.created_at, o.items_summary
+        FROM orders o
+        WHERE o.user_id = ? AND (o.created_at, o.id) < (?, ?)
+        ORDER BY o.created_at DESC, o.id DESC
+        LIMIT ?
+    ''', (1, '2025-01-01 00:00:00', 100, 21)),
+    'item summaries for orders not backfilled': ('''
+        SELECT oi.order_id, GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')')
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id IN (?, ?, ?)
+        GROUP BY oi.order_id
+    ''', (1, 2, 3)),
+    'order confirmation / tracking': (f'''
+        SELECT o.id, o.total_amount, {effective_status()}, o.shipping_address, o.created_at, o.items_summary
+        FROM orders o
+        WHERE o.id = ? AND o.user_id = ?
+    ''', (1, 1)),
+    'order summary backfill': ('''
+        SELECT id FROM orders WHERE id > ? AND items_summary IS NULL ORDER BY id LIMIT ?
+    ''', (0, 1000)),
+    'products a user bought': ('''
+        SELECT DISTINCT p.id, p.name
+        FROM products p
+        JOIN order_items oi ON p.id = oi.product_id
+        JOIN orders o ON oi.order_id = o.id
+        WHERE o.user_id = ?
+        LIMIT 3
+    ''', (1,)),
+    'recommendation history': ('''
+        SELECT oi.product_id, MAX(o.created_at) AS last_bought
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.user_id = ?
+        GROUP BY oi.product_id
+        ORDER BY last_bought DESC
+        LIMIT ?
+    ''', (1, 20)),
+    'delivered sweep': (f"UPDATE orders SET status = 'delivered' WHERE {allowed('delivered')}", ()),
+    'cancel orders': (f'''
+        UPDATE orders SET status = 'cancelled'
+        WHERE id IN (?, ?) AND user_id = ? AND ({allowed('cancelled', by_id=True)})
+    ''', (1, 2, 1)),
+    'saved addresses': ('SELECT * FROM user_addresses WHERE user_id = ?', (1,)),
+    'checkout idempotency key': ('SELECT id FROM orders WHERE user_id = ? AND idempotency_key = ?', (1, 'key')),
+    'cart contents': ('SELECT product_id, quantity FROM cart_items WHERE user_id = ? ORDER BY rowid', (1,)),
+}
+
+# Tables that must never be read with a full scan on these paths
+INDEXED_TABLES = ('orders', 'order_items', 'user_addresses', 'cart_items')
+
+
+def full_scans(plan):
+    """Plan steps that scan one of INDEXED_TABLES without an index"""
+    scans = []
+    for detail in plan:
+        words = detail.split()
+        if (len(words) >= 2 and words[0] == 'SCAN'
+                and words[1] in INDEXED_TABLES + ('o', 'oi')
+                and 'INDEX' not in detail):
+            scans.append(detail)
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=db.DEFAULT_DATABASE)
+    args = parser.parse_args()
+
+    failed = False
+    with db.connection(args.database) as conn:
+        version = migrations.schema_version(conn)
+        if version < migrations.SCHEMA_VERSION:
+            sys.exit(f"{args.database} is at schema version {version}; run python migrations.py first")
+
+        for label, (sql, params) in HOT_QUERIES.items():
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            scans = full_scans(plan)
+            failed = failed or bool(scans)
+            print(f"{'FAIL' if scans else 'ok  '} {label}")
+            for detail in plan:
+                print(f"       {detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Overhead of the chat rate limiter and concurrency gate, per message.
+
+    python -m benchmarks.rate_limit [--database bench.db] [--calls 20000] [--clients 1000]
+
+Times acquire() for the in-memory and the shared SQLite limiter, spread over
+--clients keys, and a gate enter/leave. With --database it also times
+POST /chatbot with a keyword message (no NLP) with the limiter off, in
+memory and shared; limits are set so that nothing is turned away, so the
+difference is the cost of the allowed path. The database is only written to
+in its rate_limits table.
+"""
+import argparse
+import itertools
+import time
+
+import db
+import migrations
+from rate_limit import ConcurrencyGate, MemoryRateLimiter, SQLiteRateLimiter
+
+# High enough that no benchmark call is ever limited
+RATE = 1e9
+BURST = 1e9
+
+
+def time_per_call(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def limiter_costs(database, calls, clients):
+    keys = itertools.cycle([f'user:{n}' for n in range(clients)])
+    gate = ConcurrencyGate(8)
+
+    def gate_pass():
+        gate.enter()
+        gate.leave()
+
+    memory = MemoryRateLimiter(RATE, BURST)
+    costs = {'memory limiter': time_per_call(lambda: memory.acquire(next(keys)), calls)}
+    if database:
+        shared = SQLiteRateLimiter(RATE, BURST, database)
+        costs['sqlite limiter'] = time_per_call(lambda: shared.acquire(next(keys)), calls)
+    costs['gate enter/leave'] = time_per_call(gate_pass, calls)
+    return costs
+
+
+def endpoint_costs(database, calls, rounds=5):
+    """Best of rounds interleaved runs per configuration, so drift hits them all alike"""
+    from app import create_app
+    clients = {}
+    for label, config in [('no limiter', {'CHAT_RATE_LIMIT': 0}),
+                          ('memory limiter', {'CHAT_RATE_LIMIT': RATE * 60}),
+                          ('sqlite limiter', {'CHAT_RATE_LIMIT': RATE * 60, 'CHAT_RATE_LIMIT_SHARED': True})]:
+        app = create_app(dict(config, DATABASE=database, ORDER_SWEEP_INTERVAL=0, CHAT_RATE_BURST=BURST))
+        clients[label] = app.test_client()
+        clients[label].post('/chatbot', json={'message': 'hi'})  # Warm up
+
+    costs = {}
+    for _ in range(rounds):
+        for label, client in clients.items():
+            seconds = time_per_call(lambda: client.post('/chatbot', json={'message': 'hi'}), calls)
+            costs[label] = min(seconds, costs.get(label, seconds))
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='a migrated database; adds the SQLite limiter and /chatbot timings')
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=1000, help='distinct keys to spread calls over')
+    args = parser.parse_args()
+
+    if args.database:
+        with db.connection(args.database) as conn:
+            migrations.migrate(conn)
+
+    for label, seconds in limiter_costs(args.database, args.calls, args.clients).items():
+        print(f"{label:<18} {seconds * 1e6:8.2f} us/call")
+
+    if args.database:
+        costs = endpoint_costs(args.database, args.calls // 10)
+        baseline = costs['no limiter']
+        print()
+        for label, seconds in costs.items():
+            print(f"POST /chatbot, {label:<15} {seconds * 1e6:8.1f} us/request "
+                  f"({(seconds - baseline) * 1e6:+.1f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Requests per second against 1 to N preforked workers, to check the app
+scales across cores.
+
+    python -m benchmarks.scaling --database bench.db [--workers 1,2,4]
+        [--clients 16] [--seconds 10] [--output report.json]
+
+For each worker count it starts `gunicorn -c gunicorn.conf.py wsgi:app` on a
+free port, logs --clients client processes in as users generated by
+benchmarks.datagen and has each loop over PATHS for --seconds. Clients are
+processes, not threads, so the load generator is not capped at one core.
+Each run reports throughput, p50/p99 latency and the speedup over the first
+worker count. --command runs a different server; {workers}, {host}, {port}
+and {bind} are filled in.
+"""
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import shlex
+import socket
+import sqlite3
+import subprocess
+import time
+from urllib.parse import urlencode
+
+COMMAND = 'gunicorn -c gunicorn.conf.py --workers {workers} --bind {bind} wsgi:app'
+HOST = '127.0.0.1'
+# Pages every client requests in turn
+PATHS = ['/', '/cart', '/orders', '/checkout']
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(port, server, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'Server exited with status {server.returncode}')
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=1)
+            conn.request('GET', '/login')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'Server did not answer on port {port} within {timeout:.0f}s')
+
+
+def login(conn, email):
+    conn.request('POST', '/login', urlencode({'email': email, 'password': 'password'}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie', '')
+    if response.status != 302 or not cookie.startswith('session='):
+        raise RuntimeError(f'Could not log in as {email}')
+    return cookie.split(';', 1)[0]
+
+
+def client(port, email, start_at, seconds):
+    """Run in a client process: (latencies in ms, errors) over the timed window"""
+    conn = http.client.HTTPConnection(HOST, port, timeout=30)
+    headers = {'Cookie': login(conn, email)}
+    latencies, errors = [], 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + seconds
+    n = 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', PATHS[n % len(PATHS)], headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(HOST, port, timeout=30)
+        latencies.append((time.perf_counter() - start) * 1000)
+        n += 1
+    conn.close()
+    return latencies, errors
+
+
+def run(command, workers, database, emails, seconds):
+    port = free_port()
+    argv = shlex.split(command.format(workers=workers, host=HOST, port=port, bind=f'{HOST}:{port}'))
+    env = dict(os.environ, ECOMMERCE_DB=database, ORDER_SWEEP_INTERVAL='0')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(argv, cwd=root, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, server)
+        # Leave time for every client to start and log in before the window opens
+        start_at = time.time() + 2 + len(emails) * 0.05
+        with multiprocessing.Pool(len(emails)) as pool:
+            results = pool.starmap(client, [(port, email, start_at, seconds) for email in emails])
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = sorted(ms for result, _ in results for ms in result)
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='a database filled by benchmarks.datagen')
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})),
+                        help='comma-separated worker counts (default 1,2,<cores>)')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client processes')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--command', default=COMMAND, help=f'server command (default: {COMMAND})')
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    emails = [row[0] for row in conn.execute(
+        "SELECT email FROM users WHERE email LIKE 'user%@example.com' ORDER BY id LIMIT ?", (args.clients,))]
+    conn.close()
+    if len(emails) < args.clients:
+        parser.exit(1, f'{args.database} needs {args.clients} generated users; '
+                       f'run python -m benchmarks.datagen first.\n')
+
+    print(f"{os.cpu_count()} cores, {args.clients} clients, {args.seconds:.0f}s per run")
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8}")
+    runs = []
+    for workers in [int(n) for n in args.workers.split(',')]:
+        result = run(args.command, workers, args.database, emails, args.seconds)
+        runs.append(result)
+        baseline = runs[0]['requests_per_second']
+        speedup = result['requests_per_second'] / baseline if baseline else 0.0
+        print(f"{workers:>7} {result['requests_per_second']:>9.0f} {result['p50_ms']:>8.2f} "
+              f"{result['p99_ms']:>8.2f} {result['errors']:>7} {speedup:>7.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cores': os.cpu_count(), 'clients': args.clients, 'seconds': args.seconds,
+                       'command': args.command, 'runs': runs}, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
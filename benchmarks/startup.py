@@ -0,0 +1,64 @@
+"""Startup time and peak RSS of building the app, with and without the chatbot warmed.
+
+Each mode runs in a fresh interpreter so imports and memory are not shared:
+
+    lazy       import app and create_app(); the spaCy model is not loaded
+    warmed     then load the trimmed pipeline (tok2vec only)
+    full       then load the full en_core_web_sm pipeline,
+               which is what the app used to do at import time
+
+    python -m benchmarks.startup [--runs 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+chatbot = app.create_app().extensions['shop'].chatbot
+imported = time.perf_counter()
+mode = sys.argv[1]
+if mode == 'warmed':
+    chatbot.warm_up(background=False)
+elif mode == 'full':
+    import spacy
+    spacy.load(chatbot.model)
+ready = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'ready_s': ready - start,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+MODES = ['lazy', 'warmed', 'full']
+
+
+def run_probe(mode):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', PROBE, mode],
+                            cwd=root, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'import (s)':>11} {'ready (s)':>10} {'max RSS (MB)':>13}")
+    for mode in MODES:
+        results = [run_probe(mode) for _ in range(args.runs)]
+        print(f"{mode:<8} "
+              f"{statistics.median(r['import_s'] for r in results):>11.3f} "
+              f"{statistics.median(r['ready_s'] for r in results):>10.3f} "
+              f"{statistics.median(r['max_rss_mb'] for r in results):>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
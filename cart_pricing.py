@@ -0,0 +1,47 @@
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+MAX_IDS_PER_QUERY = 500
+
+
+def _as_id(product_id):
+    try:
+        return int(product_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_products(conn, product_ids):
+    """Map product id -> product row, fetching all ids with as few queries as possible"""
+    ids = [i for i in dict.fromkeys(_as_id(product_id) for product_id in product_ids) if i is not None]
+    products = {}
+    c = conn.cursor()
+    for start in range(0, len(ids), MAX_IDS_PER_QUERY):
+        chunk = ids[start:start + MAX_IDS_PER_QUERY]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'SELECT * FROM products WHERE id IN ({placeholders})', chunk)
+        for product in c.fetchall():
+            products[product[0]] = product
+    return products
+
+
+def price_cart(cart, products):
+    """Price a {product_id: quantity} cart against a {product_id: product row}
+    mapping, from fetch_products() or the catalog cache.
+
+    Returns (items, total). Items keep the cart's order and have the keys the
+    cart template uses; lines for products that no longer exist are dropped.
+    """
+    items = []
+    total = 0
+    for product_id, quantity in cart.items():
+        product = products.get(_as_id(product_id))
+        if product:
+            subtotal = product[3] * quantity
+            items.append({
+                'id': product[0],
+                'name': product[1],
+                'price': product[3],
+                'quantity': quantity,
+                'subtotal': subtotal
+            })
+            total += subtotal
+    return items, total
@@ -0,0 +1,171 @@
+import db
+from lru import LRUCache
+
+
+class SQLiteCartStore:
+    """Carts in the cart_items table, one row per (user, product).
+
+    Every change is a single atomic statement, so concurrent requests from
+    any number of workers never lose an update. Carts are {product_id: quantity}
+    dicts in the order products were first added.
+
+    Each change also bumps the user's row in cart_versions in the same
+    transaction, so a cache can tell whether its copy of a cart is current.
+    """
+
+    def __init__(self, database=None):
+        self.database = database
+
+    def get(self, user_id):
+        return self.get_versioned(user_id)[0]
+
+    def get_versioned(self, user_id):
+        """(cart, version); the version is read first, so it is never newer than the cart"""
+        with db.connection(self.database) as conn:
+            c = conn.cursor()
+            version = self._version(c, user_id)
+            c.execute('SELECT product_id, quantity FROM cart_items WHERE user_id = ? ORDER BY rowid',
+                      (user_id,))
+            return dict(c.fetchall()), version
+
+    def version(self, user_id):
+        with db.connection(self.database) as conn:
+            return self._version(conn.cursor(), user_id)
+
+    def _version(self, c, user_id):
+        c.execute('SELECT version FROM cart_versions WHERE user_id = ?', (user_id,))
+        row = c.fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, c, user_id):
+        c.execute('''
+            INSERT INTO cart_versions (user_id, version) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+            RETURNING version
+        ''', (user_id,))
+        return c.fetchone()[0]
+
+    def add(self, user_id, product_id, delta=1):
+        """Change a line's quantity by delta; returns the new quantity, 0 once the line is gone"""
+        return self.add_versioned(user_id, product_id, delta)[0]
+
+    def add_versioned(self, user_id, product_id, delta=1):
+        """add(), returning (quantity, the cart's new version)"""
+        with db.connection(self.database) as conn:
+            c = conn.cursor()
+            try:
+                if delta > 0:
+                    c.execute('''
+                        INSERT INTO cart_items (user_id, product_id, quantity)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity
+                        RETURNING quantity
+                    ''', (user_id, product_id, delta))
+                    quantity = c.fetchone()[0]
+                else:
+                    # Lines that would drop to zero are removed instead
+                    c.execute('DELETE FROM cart_items WHERE user_id = ? AND product_id = ? AND quantity <= ?',
+                              (user_id, product_id, -delta))
+                    quantity = 0
+                    if c.rowcount == 0:
+                        c.execute('''
+                            UPDATE cart_items SET quantity = quantity + ?
+                            WHERE user_id = ? AND product_id = ?
+                            RETURNING quantity
+                        ''', (delta, user_id, product_id))
+                        row = c.fetchone()
+                        quantity = row[0] if row else 0
+                version = self._bump(c, user_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return quantity, version
+
+    def clear(self, user_id, ordered=None):
+        """Empty the cart; with ordered, a {product_id: quantity} cart, only remove
+        the lines that still match it, keeping anything added since it was read"""
+        self.clear_versioned(user_id, ordered)
+
+    def clear_versioned(self, user_id, ordered=None):
+        """clear(), returning the cart's new version"""
+        with db.connection(self.database) as conn:
+            c = conn.cursor()
+            try:
+                if ordered is None:
+                    c.execute('DELETE FROM cart_items WHERE user_id = ?', (user_id,))
+                else:
+                    c.executemany('DELETE FROM cart_items WHERE user_id = ? AND product_id = ? AND quantity = ?',
+                                  [(user_id, product_id, quantity) for product_id, quantity in ordered.items()])
+                version = self._bump(c, user_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return version
+
+
+class CachedCartStore:
+    """Write-through LRU cache in front of a SQLiteCartStore.
+
+    A cached cart is served only while its version matches the user's row in
+    cart_versions, so a change made by another worker process is seen on the
+    next read; a hit costs one primary-key lookup instead of reading the cart.
+    Entries also expire after ttl seconds. The cache's lock is only held for
+    dict operations: database calls run outside it, and a cart is never
+    replaced by an older version.
+    """
+
+    def __init__(self, backend, max_size=10000, ttl=60):
+        self.backend = backend
+        self._carts = LRUCache(max_size, ttl)  # user_id -> (cart, version)
+
+    def _store(self, user_id, cart, version):
+        with self._carts.lock:
+            entry = self._carts.peek(user_id)
+            if entry is None or entry[1] <= version:
+                self._carts.put(user_id, (cart, version))
+
+    def get(self, user_id):
+        version = self.backend.version(user_id)
+        entry = self._carts.get(user_id, valid=lambda entry: entry[1] == version)
+        if entry is not None:
+            return dict(entry[0])
+
+        cart, version = self.backend.get_versioned(user_id)
+        self._store(user_id, cart, version)
+        return dict(cart)
+
+    def add(self, user_id, product_id, delta=1):
+        quantity, version = self.backend.add_versioned(user_id, product_id, delta)
+        with self._carts.lock:
+            entry = self._carts.peek(user_id)
+            # Only a cart one version behind is this write away from current
+            if entry is not None and entry[1] == version - 1:
+                cart = dict(entry[0])
+                if quantity:
+                    cart[product_id] = quantity
+                else:
+                    cart.pop(product_id, None)
+                self._carts.put(user_id, (cart, version))
+            elif entry is not None and entry[1] < version:
+                self._carts.pop(user_id)
+        return quantity
+
+    def clear(self, user_id, ordered=None):
+        version = self.backend.clear_versioned(user_id, ordered)
+        if ordered is None:
+            self._store(user_id, {}, version)
+        else:
+            self._carts.pop(user_id)
+
+    def stats(self):
+        return self._carts.stats()
+
+
+def create_cart_store(database=None, cache_size=10000, cache_ttl=60):
+    """SQLite cart store, behind an in-memory cache unless cache_size is 0"""
+    store = SQLiteCartStore(database)
+    if cache_size > 0:
+        store = CachedCartStore(store, cache_size, cache_ttl)
+    return store
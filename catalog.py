@@ -0,0 +1,120 @@
+import threading
+import time
+
+import db
+
+
+class ProductCatalog:
+    """In-memory copy of the products table, indexed by id and by name.
+
+    Reads are served from memory. At most once per check_interval seconds a
+    read also reads catalog_version, which triggers bump on every insert,
+    update or delete of a product, and reloads the table if it changed;
+    invalidate() forces a reload on the next read after a write made by this
+    process.
+    """
+
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # (product rows in id order, {id: row}, {lowercased name: row}), replaced
+        # whole, so a reader never sees one reload's rows with another's indexes
+        self._snapshot = None
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        return None
+
+    def _ensure_loaded(self):
+        """The current (products, by_id, by_name) snapshot, reloading it first if needed"""
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._fresh_snapshot()
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+
+            with db.connection() as conn:
+                c = conn.cursor()
+                c.execute('SELECT version FROM catalog_version')
+                fingerprint = c.fetchone()
+                if self._snapshot is not None and fingerprint == self._fingerprint:
+                    self._checked_at = time.monotonic()
+                    self.hits += 1
+                    return self._snapshot
+
+                c.execute('SELECT * FROM products ORDER BY id')
+                products = c.fetchall()
+
+            by_name = {}
+            for product in products:
+                by_name.setdefault(product[1].lower(), product)
+            self._snapshot = (products, {product[0]: product for product in products}, by_name)
+            self._fingerprint = fingerprint
+            self._checked_at = time.monotonic()
+            self.version += 1
+            self.misses += 1
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop the cached table; the next read reloads it"""
+        with self._lock:
+            self._snapshot = None
+            self._fingerprint = None
+
+    def all(self):
+        """Every product row, in id order"""
+        return self._ensure_loaded()[0]
+
+    def products_by_id(self):
+        """Mapping of product id -> product row"""
+        return self._ensure_loaded()[1]
+
+    def get(self, product_id):
+        by_id = self._ensure_loaded()[1]
+        try:
+            return by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_name(self, name):
+        """Product whose name is exactly name, ignoring case"""
+        return self._ensure_loaded()[2].get(name.lower())
+
+    def find_by_name(self, name):
+        """Exact case-insensitive name match, else the first product whose name
+        contains name (the same row `name LIKE '%name%'` returns)"""
+        products, _, by_name = self._ensure_loaded()
+        needle = name.lower()
+        product = by_name.get(needle)
+        if product:
+            return product
+        for product in products:
+            if needle in product[1].lower():
+                return product
+        return None
+
+    def stats(self):
+        total = self.hits + self.misses
+        snapshot = self._snapshot
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'products': len(snapshot[1]) if snapshot else 0,
+            'version': self.version,
+        }
+
+
+catalog = ProductCatalog()
@@ -1,19 +1,44 @@
-import sqlite3
-import spacy
+import numpy as np
 import re
-from datetime import datetime, timedelta
+import threading
+from collections import namedtuple
 import random
+import db
+import metrics
+from intent_matcher import KeywordMatcher
+from cart_pricing import price_cart
+from catalog import catalog
+from recommendations import recommender
+import search
+from order_status import cancel_order, refusal
+import order_history
+from intent_cache import IntentCache, message_template, number_slot
+
+NLP_MODEL = "en_core_web_sm"
+
+# What process_message decided to do with a message. effects are (name, args)
+# pairs that Chatbot.execute runs exactly once; redirect is an endpoint name.
+ChatAction = namedtuple('ChatAction', 'intent entities reply effects redirect', defaults=((), None))
+
+# detect_intent only needs Doc.vector, which for the small English model is the
+# mean of the tok2vec output, so every other pipeline component is left out
+NLP_EXCLUDE = ["tagger", "parser", "attribute_ruler", "lemmatizer", "ner", "senter"]
 
 class Chatbot:
-    def __init__(self):
-        # Load spaCy model
-        try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except:
-            # If model not found, download it
-            import subprocess
-            subprocess.run(["python", "-m", "spacy", "download", "en_core_web_sm"])
-            self.nlp = spacy.load("en_core_web_sm")
+    def __init__(self, model=NLP_MODEL, intent_cache=None, cart_store=None):
+        # The spaCy model is loaded on first use (or by warm_up)
+        self.model = model
+        self._nlp = None
+        self._nlp_lock = threading.Lock()
+        # (intent per keyword, row-normalized keyword vectors or None), replaced whole
+        # so a reader never pairs one build's matrix with another's intents
+        self.keyword_index = ([], None)
+        # Optional callable text -> vector, e.g. NLPWorker.vector, used instead of self.nlp
+        self.vectorizer = None
+        # Resolved intents and entities of recent messages
+        self.intent_cache = intent_cache if intent_cache is not None else IntentCache()
+        # Where chat "add to cart" requests put products (see cart_store)
+        self.cart_store = cart_store
         
         # Define intents and their keywords
         self.intents = {
@@ -23,9 +48,21 @@ class Chatbot:
             "order_cancellation": ["cancel", "stop", "return", "refund", "don't want"],
             "product_recommendation": ["recommend", "suggestion", "similar", "like", "suggest", "what else", "more products"],
             "help": ["help", "support", "assistance", "guide", "how to", "how do I"],
-            "goodbye": ["bye", "goodbye", "see you", "talk to you later", "thanks", "thank you"]
+            "goodbye": ["bye", "goodbye", "see you", "talk to you later", "thanks", "thank you"],
+            "view_cart": ["view cart", "show cart", "my cart", "open cart"],
+            "checkout": ["checkout", "check out", "place order", "proceed to checkout"]
         }
         
+        # Explicit commands that win over keyword scores, checked in this order
+        self.commands = [
+            ("track order", "order_tracking"),
+            ("cancel order", "order_cancellation"),
+            ("view cart", "view_cart"),
+            ("checkout", "checkout"),
+            ("check out", "checkout"),
+            ("place order", "checkout"),
+        ]
+        
         # Product name patterns for extraction
         self.product_pattern = re.compile(r'(idli|dosa|upma|poha|pancake|cake|vanilla|strawberry|thandai|badam|chutney|sambar|rasam)\s*(mix)?', re.IGNORECASE)
         
@@ -34,54 +71,131 @@ class Chatbot:
         
         # Simple number pattern for order ID
         self.number_pattern = re.compile(r'#?(\d+)')
+        
+        # Keyword matcher built from the intents above
+        self.matcher = KeywordMatcher(self.intents)
+    
+    def add_intent_keywords(self, intent, keywords):
+        """Add keywords to an intent (creating it if needed) and rebuild the matchers"""
+        self.intents.setdefault(intent, []).extend(keywords)
+        self.matcher = KeywordMatcher(self.intents)
+        if self._nlp is not None:
+            self.build_keyword_vectors()
+        self.intent_cache.clear()
+    
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self.load_nlp()
+        return self._nlp
+    
+    def load_nlp(self):
+        """Load the trimmed spaCy pipeline and the keyword vectors, once"""
+        with self._nlp_lock:
+            if self._nlp is not None:
+                return
+            
+            import spacy  # Deferred: importing spaCy alone takes most of a second
+            try:
+                nlp = spacy.load(self.model, exclude=NLP_EXCLUDE)
+            except OSError as e:
+                raise RuntimeError(
+                    f"spaCy model '{self.model}' is not installed. "
+                    f"Install it before starting the app: python -m spacy download {self.model}"
+                ) from e
+            
+            # Keyword vectors are ready before any other thread can see the model
+            self.build_keyword_vectors(nlp)
+            self._nlp = nlp
+    
+    def warm_up(self, background=True):
+        """Load the model now instead of on the first chat message"""
+        if not background:
+            self.load_nlp()
+            return None
+        
+        def load():
+            try:
+                self.load_nlp()
+            except Exception as e:
+                print(f"Chatbot warm-up failed: {str(e)}")
+        
+        thread = threading.Thread(target=load, name="chatbot-warm-up", daemon=True)
+        thread.start()
+        return thread
+    
+    def build_keyword_vectors(self, nlp=None):
+        """Precompute a row-normalized matrix of keyword vectors, one row per keyword"""
+        nlp = nlp or self.nlp
+        keyword_intents = []
+        keywords = []
+        for intent, intent_keywords in self.intents.items():
+            for keyword in intent_keywords:
+                keyword_intents.append(intent)
+                keywords.append(keyword)
+        
+        if not keywords:
+            self.keyword_index = ([], None)
+            return
+        
+        vectors = np.array([doc.vector for doc in nlp.pipe(keywords)], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Keywords without a vector keep a zero row, i.e. similarity 0 like Doc.similarity
+        norms[norms == 0] = 1
+        self.keyword_index = (keyword_intents, vectors / norms)
+    
+    def similar_intent(self, message, threshold=0.7):
+        """Return the intent whose keyword is most similar to the message, if above threshold"""
+        with metrics.stage('nlp'):
+            vector = self.vectorizer(message) if self.vectorizer else self.nlp(message).vector
+        keyword_intents, keyword_matrix = self.keyword_index
+        if keyword_matrix is None:
+            return None
+        
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        
+        # Cosine similarity against every keyword in one pass
+        similarities = keyword_matrix @ (vector / norm)
+        best = int(np.argmax(similarities))
+        if similarities[best] > threshold:
+            return keyword_intents[best]
+        return None
     
     def detect_intent(self, message):
         """Detect the user's intent from their message"""
-        doc = self.nlp(message.lower())
-        
-        # Check for each intent
-        max_score = 0
-        detected_intent = "unknown"
-        
-        for intent, keywords in self.intents.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in message.lower():
-                    score += 1
-            
-            if score > max_score:
-                max_score = score
-                detected_intent = intent
-        
-        # If no intent was detected with keywords, use spaCy similarity
-        if detected_intent == "unknown":
-            for intent, keywords in self.intents.items():
-                for keyword in keywords:
-                    keyword_doc = self.nlp(keyword)
-                    try:
-                        similarity = doc.similarity(keyword_doc)
-                        if similarity > 0.7 and similarity > max_score:  # Threshold for similarity
-                            max_score = similarity
-                            detected_intent = intent
-                    except:
-                        # Handle case where similarity can't be computed
-                        pass
+        text = message.lower()
         
         # Special case for single word "track" or "cancel"
-        if message.lower().strip() == "track":
+        if text.strip() == "track":
             return "order_tracking"
-        if message.lower().strip() == "cancel":
+        if text.strip() == "cancel":
             return "order_cancellation"
         
         # Handle "cancel #order" cases
-        if "cancel" in message.lower() and any(word.isdigit() for word in message.split()):
+        if "cancel" in text and any(word.isdigit() for word in message.split()):
             return "order_cancellation"
         
+        for phrase, intent in self.commands:
+            if phrase in text:
+                return intent
+        
+        # Score every intent in a single scan of the message
+        detected_intent = self.matcher.best_intent(text)
+        
+        # If no intent was detected with keywords, use spaCy similarity
+        if detected_intent is None:
+            detected_intent = self.similar_intent(text) or "unknown"
+        
         return detected_intent
     
     def extract_product_name(self, message):
         """Extract product name from user message"""
-        match = self.product_pattern.search(message)
+        return self.product_name(self.product_pattern.search(message))
+    
+    def product_name(self, match):
+        """Product name from a product_pattern match, or None"""
         if match:
             product_name = match.group(0).strip()
             # Ensure "Mix" is capitalized for database matching
@@ -92,238 +206,204 @@ class Chatbot:
     
     def extract_order_id(self, message):
         """Extract order ID from user message"""
-        # First try the standard order ID pattern
-        match = self.order_id_pattern.search(message)
-        if match:
-            return match.group(1)
-        
-        # Then try to find any number in the message as a fallback
-        match = self.number_pattern.search(message)
-        if match:
-            return match.group(1)
-        
-        # If no number found, return None
-        return None
+        match = self.match_order_id(message)
+        return match.group(1) if match else None
     
+    def match_order_id(self, message):
+        """Regex match whose group 1 is the order ID, or None"""
+        # First try the standard order ID pattern, then any number in the message as a fallback
+        return self.order_id_pattern.search(message) or self.number_pattern.search(message)
+    
+    def resolve(self, message):
+        """Detect the intent and extract entities, reusing earlier results for messages
+        that differ only in case, spacing, numbers or the product named"""
+        product_match = self.product_pattern.search(message)
+        key, numbers = message_template(message, product_match.span() if product_match else None)
+        product_name = self.product_name(product_match)
+        cached = self.intent_cache.get(key)
+        if cached is not None:
+            intent, order_slot = cached
+            order_id = numbers[order_slot] if order_slot is not None else None
+            return intent, {"product_name": product_name, "order_id": order_id}
+        
+        with metrics.stage('intent'):
+            intent = self.detect_intent(message)
+        with metrics.stage('entities'):
+            match = self.match_order_id(message)
+            order_id = match.group(1) if match else None
+        
+        # Remember which number was the order ID rather than its value
+        order_slot = number_slot(message, order_id, match.start(1)) if match else None
+        if order_id is None or order_slot is not None:
+            self.intent_cache.put(key, (intent, order_slot))
+        
+        return intent, {"product_name": product_name, "order_id": order_id}
+    
+    @metrics.timed('db')
     def get_product_by_name(self, product_name):
-        """Get product details from database by name"""
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
+        """Get product details by name: exact names from the catalog cache, anything else from the search index"""
+        product = catalog.get_by_name(product_name)
+        if product:
+            return product
         
-        # Use LIKE for partial matching
-        c.execute('SELECT * FROM products WHERE name LIKE ?', (f'%{product_name}%',))
-        product = c.fetchone()
-        conn.close()
-        
-        return product
+        with db.connection() as conn:
+            return search.best_match(conn, product_name)
     
+    @metrics.timed('db')
     def get_order_status(self, order_id, user_id):
         """Get order status from database"""
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT o.id, o.status, o.created_at, o.total_amount,
-                   GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')') as items
-            FROM orders o
-            JOIN order_items oi ON o.id = oi.order_id
-            JOIN products p ON oi.product_id = p.id
-            WHERE o.id = ? AND o.user_id = ?
-            GROUP BY o.id
-        ''', (order_id, user_id))
-        
-        order = c.fetchone()
-        conn.close()
-        
-        return order
-    
-    def get_user_orders(self, user_id, limit=3):
-        """Get recent orders for a user"""
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT o.id, o.status, o.created_at, o.total_amount
-            FROM orders o
-            WHERE o.user_id = ?
-            ORDER BY o.created_at DESC
-            LIMIT ?
-        ''', (user_id, limit))
-        
-        orders = c.fetchall()
-        conn.close()
-        
-        return orders
-    
-    def can_cancel_order(self, order_id, user_id):
-        """Check if an order can be cancelled (within 24 hours)"""
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT created_at, status
-            FROM orders
-            WHERE id = ? AND user_id = ?
-        ''', (order_id, user_id))
-        
-        order = c.fetchone()
-        conn.close()
-        
-        if not order:
-            return False, "Order not found"
+        with db.connection() as conn:
+            order = order_history.fetch_order(conn, order_id, user_id)
         
-        if order[1] == 'cancelled':
-            return False, "Order is already cancelled"
-        
-        order_date = datetime.strptime(order[0], '%Y-%m-%d %H:%M:%S')
-        if datetime.now() - order_date > timedelta(hours=24):
-            return False, "Order cannot be cancelled as it's been more than 24 hours"
-        
-        return True, "Order can be cancelled"
+        # (id, status, created_at, total, items) like the replies below expect
+        return order and (order[0], order[2], order[4], order[1], order[5])
     
+    @metrics.timed('db')
+    def get_user_orders(self, user_id, limit=3, cursor=None):
+        """Get recent orders for a user, newest first; pass a cursor to page further back"""
+        with db.connection() as conn:
+            orders = order_history.fetch_orders(conn, user_id, limit, cursor)
+        
+        # (id, status, created_at, total) like the replies below expect
+        return [(o[0], o[2], o[3], o[1]) for o in orders]
+    
+    @metrics.timed('db')
     def get_product_recommendations(self, user_id):
         """Get product recommendations based on user's order history"""
-        conn = sqlite3.connect('ecommerce.db')
-        c = conn.cursor()
-        
-        # Get products the user has ordered before
-        c.execute('''
-            SELECT DISTINCT p.id, p.name
-            FROM products p
-            JOIN order_items oi ON p.id = oi.product_id
-            JOIN orders o ON oi.order_id = o.id
-            WHERE o.user_id = ?
-            LIMIT 3
-        ''', (user_id,))
-        
-        user_products = c.fetchall()
-        
-        # If user has no order history, recommend popular products
-        if not user_products:
-            c.execute('SELECT id, name FROM products ORDER BY RANDOM() LIMIT 3')
-            recommendations = c.fetchall()
-        else:
-            # Get similar products (simple implementation - in real world, use ML)
-            product_ids = [p[0] for p in user_products]
-            placeholders = ','.join(['?'] * len(product_ids))
-            
-            c.execute(f'''
-                SELECT id, name FROM products 
-                WHERE id NOT IN ({placeholders})
-                ORDER BY RANDOM() LIMIT 3
-            ''', product_ids)
-            
-            recommendations = c.fetchall()
+        with db.connection() as conn:
+            # Products bought together with the user's recent purchases, or best sellers
+            product_ids = recommender.recommend(conn, user_id, k=3)
         
-        conn.close()
-        return recommendations
+        return [product for product in map(catalog.get, product_ids) if product]
     
-    def process_message(self, message, user_id=None, session=None):
-        """Process user message and return appropriate response"""
-        intent = self.detect_intent(message)
+    def process_message(self, message, user_id=None):
+        """Work out the reply to a message and the actions it calls for, without
+        changing anything; pass the result to execute()"""
+        intent, entities = self.resolve(message)
+        action = ChatAction(intent, entities, None)
         
         if intent == "greeting":
-            return "Hello! How can I help you today? You can ask me about products, track your orders, or get recommendations."
+            return action._replace(reply="Hello! How can I help you today? You can ask me about products, track your orders, or get recommendations.")
         
         elif intent == "goodbye":
-            return "Thank you for chatting! If you need anything else, I'm here to help."
+            return action._replace(reply="Thank you for chatting! If you need anything else, I'm here to help.")
         
         elif intent == "help":
-            return "I can help you with: placing orders, tracking your orders, cancelling orders, and recommending products. What would you like to do?"
+            return action._replace(reply="I can help you with: placing orders, tracking your orders, cancelling orders, and recommending products. What would you like to do?")
         
-        elif intent == "order_placement":
-            product_name = self.extract_product_name(message)
-            
-            if not product_name:
-                return "What product would you like to order? We have Idli Mix, Dosa Mix, Upma Mix, and many more!"
-            
+        elif intent in ("order_placement", "checkout") and entities["product_name"]:
+            # "add idli mix to cart and checkout" adds the product, then goes to checkout
+            product_name = entities["product_name"]
             product = self.get_product_by_name(product_name)
+            redirect = "checkout" if intent == "checkout" else None
             
             if not product:
-                return f"I couldn't find {product_name} in our inventory. Would you like to see our available products?"
+                return action._replace(reply=f"I couldn't find {product_name} in our inventory. Would you like to see our available products?")
             
-            # Add product to cart in session
-            if session is not None:
-                if 'cart' not in session:
-                    session['cart'] = {}
-                
-                cart = session['cart']
-                product_id = str(product[0])
-                if product_id in cart:
-                    cart[product_id] += 1
-                else:
-                    cart[product_id] = 1
-                
-                session['cart'] = cart
-                return f"{product[1]} has been added to your cart. Would you like to proceed to checkout or continue shopping?"
-            else:
-                return "Please log in to add products to your cart."
+            if not user_id or self.cart_store is None:
+                return action._replace(reply="Please log in to add products to your cart.")
+            
+            return action._replace(reply=f"Adding {product[1]} to your cart.",
+                                   effects=(("add_to_cart", (product[0], product[1])),),
+                                   redirect=redirect)
+        
+        elif intent == "order_placement":
+            return action._replace(reply="What product would you like to order? We have Idli Mix, Dosa Mix, Upma Mix, and many more!")
+        
+        elif intent == "checkout":
+            if not user_id or self.cart_store is None:
+                return action._replace(reply="Please log in to check out.")
+            if not self.cart_store.get(user_id):
+                return action._replace(reply="Your cart is empty. Add products before checking out.")
+            return action._replace(reply="Taking you to checkout to complete your order.", redirect="checkout")
+        
+        elif intent == "view_cart":
+            if not user_id:
+                return action._replace(reply="Please log in to view your cart.")
+            return action._replace(reply="Taking you to your cart.", redirect="cart")
         
         elif intent == "order_tracking":
-            order_id = self.extract_order_id(message)
+            order_id = entities["order_id"]
             
             if not order_id:
                 if user_id:
                     orders = self.get_user_orders(user_id)
                     if orders:
                         orders_text = "\n".join([f"Order #{o[0]}: {o[1]}, Total: ₹{o[3]}" for o in orders])
-                        return f"Here are your recent orders:\n{orders_text}\n\nWhich order would you like to track?"
+                        return action._replace(reply=f"Here are your recent orders:\n{orders_text}\n\nWhich order would you like to track?")
                 
-                return "Please provide your order ID so I can track it for you."
+                return action._replace(reply="Please provide your order ID so I can track it for you.")
             
             if not user_id:
-                return "Please log in to track your order."
+                return action._replace(reply="Please log in to track your order.")
             
             order = self.get_order_status(order_id, user_id)
             
             if not order:
-                return f"I couldn't find order #{order_id}. Please check the order number and try again."
+                return action._replace(reply=f"I couldn't find order #{order_id}. Please check the order number and try again.")
             
             status = order[1]
             items = order[4] if len(order) > 4 else "your items"
-            return f"Your order #{order_id} is currently {status}. The total amount is ₹{order[3]}. Items: {items}"
+            return action._replace(reply=f"Your order #{order_id} is currently {status}. The total amount is ₹{order[3]}. Items: {items}")
         
         elif intent == "order_cancellation":
-            order_id = self.extract_order_id(message)
+            order_id = entities["order_id"]
             
             if not order_id:
                 if user_id:
                     orders = self.get_user_orders(user_id)
                     if orders:
                         orders_text = "\n".join([f"Order #{o[0]}: {o[1]}, Total: ₹{o[3]}" for o in orders])
-                        return f"Here are your recent orders:\n{orders_text}\n\nWhich order would you like to cancel?"
+                        return action._replace(reply=f"Here are your recent orders:\n{orders_text}\n\nWhich order would you like to cancel?")
                 
-                return "Please provide your order ID so I can cancel it for you."
+                return action._replace(reply="Please provide your order ID so I can cancel it for you.")
             
             if not user_id:
-                return "Please log in to cancel your order."
-            
-            can_cancel, reason = self.can_cancel_order(order_id, user_id)
+                return action._replace(reply="Please log in to cancel your order.")
             
-            if can_cancel:
-                # Call the cancel_order route to update the database
-                return f"I've initiated the cancellation for order #{order_id}. You'll receive a refund soon."
-            else:
-                return reason
+            return action._replace(reply=f"Cancelling order #{order_id}.",
+                                   effects=(("cancel_order", (order_id,)),))
         
         elif intent == "product_recommendation":
             if not user_id:
-                return "Please log in to get personalized recommendations."
+                return action._replace(reply="Please log in to get personalized recommendations.")
             
             recommendations = self.get_product_recommendations(user_id)
             
             if not recommendations:
-                return "I don't have enough information to make recommendations yet. Try exploring our product catalog!"
+                return action._replace(reply="I don't have enough information to make recommendations yet. Try exploring our product catalog!")
             
             rec_text = "Based on your preferences, you might like: " + ", ".join([r[1] for r in recommendations])
-            return rec_text
+            return action._replace(reply=rec_text)
         
         else:
             # Handle cases where the intent is unclear
-            product_name = self.extract_product_name(message)
+            product_name = entities["product_name"]
             if product_name:
                 product = self.get_product_by_name(product_name)
                 if product:
-                    return f"Are you looking to add {product[1]} to your cart? Please say 'add {product[1]} to cart' to proceed."
+                    return action._replace(reply=f"Are you looking to add {product[1]} to your cart? Please say 'add {product[1]} to cart' to proceed.")
             
-            return "I'm not sure I understand. Would you like to place an order, track an order, or get product recommendations?"
\ No newline at end of file
+            return action._replace(reply="I'm not sure I understand. Would you like to place an order, track an order, or get product recommendations?")
+    
+    def execute(self, action, user_id):
+        """Carry out an action's effects, once; returns the reply to send"""
+        reply = action.reply
+        for name, args in action.effects:
+            with metrics.stage('db'):
+                reply = getattr(self, f"_{name}")(action, user_id, *args)
+        return reply
+    
+    def _add_to_cart(self, action, user_id, product_id, name):
+        self.cart_store.add(user_id, product_id)
+        _, total = price_cart(self.cart_store.get(user_id), catalog.products_by_id())
+        if action.redirect == "checkout":
+            return f"{name} has been added to your cart (cart total: ₹{total:.2f}). Taking you to checkout."
+        return f"{name} has been added to your cart (cart total: ₹{total:.2f}). Would you like to proceed to checkout or continue shopping?"
+    
+    def _cancel_order(self, action, user_id, order_id):
+        with db.connection() as conn:
+            if cancel_order(conn, order_id, user_id):
+                return f"Order #{order_id} has been cancelled. You'll receive a refund soon."
+            # Only look up why when the cancellation did not go through
+            return refusal(conn, order_id, user_id, 'cancelled')
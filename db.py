@@ -0,0 +1,235 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context
+
+
+DEFAULT_DATABASE = os.environ.get('ECOMMERCE_DB', 'ecommerce.db')
+
+# Applied to every new connection. WAL lets readers run alongside the single
+# writer, and busy_timeout makes overlapping writers wait instead of failing
+# with "database is locked".
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=134217728',
+)
+
+# Prepared statements cached per connection, keyed by SQL text
+STATEMENT_CACHE_SIZE = 256
+
+# Called with every new connection, e.g. to install a trace callback
+_connect_hooks = []
+
+
+def on_connect(hook):
+    """Run hook(conn) on each connection opened from now on"""
+    _connect_hooks.append(hook)
+    return hook
+
+
+# Called with (sql, seconds) after every statement run through a pooled connection
+_statement_hooks = []
+
+
+def on_statement(hook):
+    """Run hook(sql, seconds) after each statement executed from now on (once, however often it is added)"""
+    if hook not in _statement_hooks:
+        _statement_hooks.append(hook)
+    return hook
+
+
+def _timed(method, sql, parameters):
+    if not _statement_hooks:
+        return method(sql, parameters)
+    start = time.perf_counter()
+    try:
+        return method(sql, parameters)
+    finally:
+        # Time to run the statement up to its first row
+        elapsed = time.perf_counter() - start
+        for hook in _statement_hooks:
+            hook(sql, elapsed)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement to the on_statement hooks"""
+
+    def execute(self, sql, parameters=()):
+        return _timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _timed(super().executemany, sql, seq_of_parameters)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, including the execute() shortcuts, are TimedCursors"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived connections to one SQLite database"""
+
+    def __init__(self, database, max_size=8, timeout=10.0):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database,
+                               timeout=self.timeout,
+                               check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE,
+                               factory=TimedConnection)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        for hook in _connect_hooks:
+            hook(conn)
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, opening a new one while under max_size"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_pools():
+    """Forget the parent's pools in a forked child.
+
+    SQLite connections must not be used across fork(), and the parent's lock
+    may have been held mid-acquire, so the child starts with fresh pools and
+    leaves the inherited connections alone.
+    """
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+
+# Preforking servers load the app, and may open connections, before forking workers
+os.register_at_fork(after_in_child=_reset_pools)
+
+
+def current_database():
+    """Database path for the active app, or the process default"""
+    if has_app_context():
+        return current_app.config.get('DATABASE', DEFAULT_DATABASE)
+    return DEFAULT_DATABASE
+
+
+def get_pool(database=None):
+    database = database or current_database()
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = _pools[database] = ConnectionPool(database)
+        return pool
+
+
+def get_db():
+    """Connection bound to the current app context, released on teardown"""
+    if 'db' not in g:
+        pool = get_pool()
+        g.db_pool = pool
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    pool = g.pop('db_pool', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+@contextmanager
+def connection(database=None):
+    """A connection to database, borrowed from its pool.
+
+    With database None, the app's database: the request's connection when
+    there is one, otherwise one from DEFAULT_DATABASE's pool. Classes that
+    take an optional database pass it straight through to here.
+    """
+    if database is None and has_app_context():
+        yield get_db()
+        return
+
+    pool = get_pool(database)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE', DEFAULT_DATABASE)
+    app.teardown_appcontext(close_db)
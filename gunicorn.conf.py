@@ -0,0 +1,21 @@
+"""gunicorn settings for wsgi.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each setting can be overridden from the environment or the command line.
+"""
+import multiprocessing
+import os
+
+# Behind a reverse proxy; wsgi.py trusts its X-Forwarded-For (PROXY_FIX_X_FOR)
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+# One process per core; each also runs the NLP and order writer threads
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Threads per worker, for requests that wait on SQLite or the NLP worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Import wsgi.py, and so migrate and load the model, once in the master before forking
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 10
+accesslog = os.environ.get('ACCESS_LOG')
@@ -0,0 +1,37 @@
+import re
+
+from lru import LRUCache
+
+_NUMBER = re.compile(r'\d+')
+_SPACES = re.compile(r'\s+')
+
+# Stand in for every run of digits, and for the product name, in a cache key
+NUMBER_SLOT = '{n}'
+PRODUCT_SLOT = '{product}'
+
+
+def message_template(message, product=None):
+    """(key, numbers) for a message: lowercased, whitespace collapsed and each
+    run of digits replaced by a slot, so "track order 41" and
+    "Track order  97" share the key "track order {n}". product, the (start, end)
+    span of a product name in message, is replaced by a slot as well."""
+    if product:
+        message = message[:product[0]] + PRODUCT_SLOT + message[product[1]:]
+    text = _SPACES.sub(' ', message.lower()).strip()
+    numbers = _NUMBER.findall(text)
+    return _NUMBER.sub(NUMBER_SLOT, text), numbers
+
+
+def number_slot(message, value, start):
+    """Index of the digit run in message that begins at start, i.e. the slot value came from"""
+    for index, match in enumerate(_NUMBER.finditer(message)):
+        if match.start() == start and match.group() == value:
+            return index
+    return None
+
+
+class IntentCache(LRUCache):
+    """Resolved intents by message template; a thread-safe LRU cache with a TTL"""
+
+    def __init__(self, max_size=10000, ttl=3600):
+        super().__init__(max_size, ttl)
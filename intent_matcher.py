@@ -0,0 +1,110 @@
+from collections import deque
+
+
+# Shorter keywords plus an "s" are usually a different word ("hi" -> "his")
+PLURAL_MIN_LENGTH = 3
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over the keywords of every intent.
+
+    A message is scanned once, whatever the number of keywords. Keywords only
+    match as whole words (so "hi" does not match inside "this"). Keywords of
+    PLURAL_MIN_LENGTH or more characters may be followed by a plural "s"
+    ("order" matches "orders", but "hi" does not match "his").
+    """
+
+    def __init__(self, intents):
+        self.build(intents)
+
+    def build(self, intents):
+        """(Re)build the automaton from an {intent: [keywords]} mapping"""
+        goto = [{}]
+        fail = [0]
+        output = [()]
+        keywords = []  # (intent, keyword length) per keyword index
+
+        for intent, intent_keywords in intents.items():
+            for keyword in intent_keywords:
+                keyword = keyword.lower()
+                if not keyword:
+                    continue
+                state = 0
+                for ch in keyword:
+                    next_state = goto[state].get(ch)
+                    if next_state is None:
+                        next_state = len(goto)
+                        goto[state][ch] = next_state
+                        goto.append({})
+                        fail.append(0)
+                        output.append(())
+                    state = next_state
+                output[state] += (len(keywords),)
+                keywords.append((intent, len(keyword)))
+
+        # Breadth-first pass to link each state to its longest proper suffix
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                suffix = fail[state]
+                while suffix and ch not in goto[suffix]:
+                    suffix = fail[suffix]
+                fail[next_state] = goto[suffix].get(ch, 0)
+                output[next_state] += output[fail[next_state]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+        self._keywords = keywords
+        self.intents = list(dict.fromkeys(intent for intent, _ in keywords))
+
+    def _ends_word(self, text, end, length):
+        if end >= len(text) or not _is_word_char(text[end - 1]):
+            return True
+        if not _is_word_char(text[end]):
+            return True
+        # Allow a plural "s" directly before the boundary, for long enough keywords
+        return (length >= PLURAL_MIN_LENGTH and text[end] == 's'
+                and (end + 1 == len(text) or not _is_word_char(text[end + 1])))
+
+    def matches(self, text):
+        """Indexes of the distinct keywords found as whole words in lowercased text"""
+        goto, fail, output, keywords = self._goto, self._fail, self._output, self._keywords
+        found = set()
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in output[state]:
+                if index in found:
+                    continue
+                start = i - keywords[index][1] + 1
+                starts_word = (start == 0 or not _is_word_char(text[start])
+                               or not _is_word_char(text[start - 1]))
+                if starts_word and self._ends_word(text, i + 1, keywords[index][1]):
+                    found.add(index)
+        return found
+
+    def score(self, text):
+        """Number of distinct keywords matched per intent"""
+        scores = {}
+        for index in self.matches(text):
+            intent = self._keywords[index][0]
+            scores[intent] = scores.get(intent, 0) + 1
+        return scores
+
+    def best_intent(self, text):
+        """Highest-scoring intent, ties going to the intent defined first; None if nothing matched"""
+        scores = self.score(text)
+        best, best_score = None, 0
+        for intent in self.intents:
+            if scores.get(intent, 0) > best_score:
+                best, best_score = intent, scores[intent]
+        return best
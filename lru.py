@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded to max_size entries, with hit, miss and
+    eviction counts.
+
+    Entries expire ttl seconds after they are put (None: never), or earlier
+    when put() is given an expiry time; times come from clock. A max_size of 0
+    or less caches nothing. lock is reentrant, so callers can hold it around
+    a peek() and put() that must happen together.
+    """
+
+    def __init__(self, max_size, ttl=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.RLock()
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= self.clock():
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key, valid=None):
+        """The value for key, marking it recently used; None, counted as a miss,
+        when there is none, it has expired or valid(value) is false"""
+        with self.lock:
+            entry = self._live(key)
+            if entry is None or (valid is not None and not valid(entry[0])):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """The value for key, without counting a hit or marking it used"""
+        with self.lock:
+            entry = self._live(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key, value, expires=None):
+        """Store value, until expires if that is sooner than ttl from now"""
+        if self.max_size <= 0:
+            return
+        if self.ttl is not None:
+            limit = self.clock() + self.ttl
+            expires = limit if expires is None else min(expires, limit)
+        elif expires is None:
+            expires = float('inf')
+        with self.lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            entry = self._entries.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,221 @@
+"""Request, SQL and chatbot-stage metrics in the Prometheus text format.
+
+init_app() times every request, counts and times the SQL statements it runs,
+serves everything at /metrics and logs requests slower than
+SLOW_REQUEST_MS. Code paths time themselves with stage():
+
+    with metrics.stage('intent'):
+        intent = detect_intent(message)
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+import db
+
+# Seconds
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+# Statements per request
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                le = (('le', bound if bound == '+Inf' else repr(float(bound))),)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {values[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Gauges:
+    """Gauges read at scrape time from a callable returning {name: number}"""
+
+    def __init__(self, prefix, help, read):
+        self.prefix = prefix
+        self.help = help
+        self.read = read
+
+    def render(self):
+        lines = []
+        for name, value in self.read().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines += [f'# HELP {self.prefix}_{name} {self.help}',
+                          f'# TYPE {self.prefix}_{name} gauge',
+                          f'{self.prefix}_{name} {value}']
+        return lines
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to handle a request.', ('endpoint',))
+REQUESTS = Counter('http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+REQUEST_STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements run by a request.',
+                               ('endpoint',), COUNT_BUCKETS)
+SQL_DURATION = Histogram('sql_statement_duration_seconds', 'Time to execute a SQL statement.',
+                         ('operation',), SQL_BUCKETS)
+STAGE_DURATION = Histogram('chatbot_stage_duration_seconds', 'Time spent in each chatbot stage.',
+                           ('stage',), SQL_BUCKETS + (2.5, 5, 10))
+
+_registry = [REQUEST_DURATION, REQUESTS, REQUEST_STATEMENTS, SQL_DURATION, STAGE_DURATION]
+
+# Per-thread record of the request being handled, for the slow-request log
+_current = threading.local()
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def register_stats(prefix, help, read):
+    """Export the numbers in read()'s dict as gauges named prefix_<key>.
+
+    Registering a prefix again replaces its gauges, so a second app built in
+    the same process reports its own objects.
+    """
+    _registry[:] = [metric for metric in _registry
+                    if not (isinstance(metric, Gauges) and metric.prefix == prefix)]
+    return register(Gauges(prefix, help, read))
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+def _operation(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else 'OTHER'
+
+
+def _record_statement(sql, seconds):
+    SQL_DURATION.observe(seconds, _operation(sql))
+    record = getattr(_current, 'record', None)
+    if record is not None:
+        record['statements'] += 1
+        record['sql_seconds'] += seconds
+
+
+@contextmanager
+def stage(name):
+    """Time a block as the given chatbot stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, name)
+        record = getattr(_current, 'record', None)
+        if record is not None:
+            record['stages'][name] = record['stages'].get(name, 0.0) + elapsed
+
+
+def timed(name):
+    """Decorator timing every call of a function as the given stage"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def init_app(app):
+    app.config.setdefault('SLOW_REQUEST_MS', 0)  # 0 turns the slow-request log off
+    db.on_statement(_record_statement)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        _current.record = {'statements': 0, 'sql_seconds': 0.0, 'stages': {}}
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        record = getattr(_current, 'record', None)
+        _current.record = None
+        if start is None or record is None:
+            return response
+
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unknown'
+        REQUEST_DURATION.observe(elapsed, endpoint)
+        REQUESTS.inc(endpoint, request.method, str(response.status_code))
+        REQUEST_STATEMENTS.observe(record['statements'], endpoint)
+
+        threshold = app.config['SLOW_REQUEST_MS']
+        if threshold and elapsed * 1000 >= threshold:
+            stages = ', '.join(f'{name} {seconds * 1000:.1f}ms' for name, seconds in record['stages'].items())
+            app.logger.warning('Slow request: %s %s %d in %.1fms (%d SQL statements, %.1fms SQL%s)',
+                               request.method, request.path, response.status_code, elapsed * 1000,
+                               record['statements'], record['sql_seconds'] * 1000,
+                               f'; {stages}' if stages else '')
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,240 @@
+"""Versioned schema migrations, tracked with PRAGMA user_version.
+
+Run them offline before deploying:
+
+    python migrations.py [--database ecommerce.db] [--status]
+"""
+import argparse
+
+import db
+import search
+
+
+def _base_tables(c):
+    # The original schema; IF NOT EXISTS adopts databases created before migrations
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            username TEXT NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            price REAL NOT NULL,
+            image TEXT NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            total_amount DECIMAL(10, 2) NOT NULL,
+            status TEXT NOT NULL,
+            shipping_address TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            price_at_time DECIMAL(10, 2) NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+
+def _product_search(c):
+    search.create_search_index(c.connection)
+
+
+def _user_addresses(c):
+    # Written by checkout() when "save this address" is ticked
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_addresses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            full_name TEXT NOT NULL,
+            street TEXT NOT NULL,
+            city TEXT NOT NULL,
+            state TEXT NOT NULL,
+            zip_code TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_user_addresses_user ON user_addresses (user_id)')
+
+
+def _hot_path_indexes(c):
+    # Order history, recent orders and tracking by user, newest first
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)')
+    # The delivered-status sweep
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)')
+    # Item lookups for an order, covering the product join
+    c.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order_product ON order_items (order_id, product_id)')
+
+
+def _cart_items(c):
+    # Server-side carts, replacing the cart in the session cookie
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cart_items (
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            PRIMARY KEY (user_id, product_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+
+def _order_idempotency_keys(c):
+    # One order per checkout form, however many times it is submitted
+    c.execute('ALTER TABLE orders ADD COLUMN idempotency_key TEXT')
+    c.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_user_idempotency
+        ON orders (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL
+    ''')
+
+
+def _order_summaries(c):
+    # "Name (xQty),..." and the number of units, written once at checkout so order
+    # reads need no join; `flask backfill-order-summaries` fills older orders
+    c.execute('ALTER TABLE orders ADD COLUMN items_summary TEXT')
+    c.execute('ALTER TABLE orders ADD COLUMN item_count INTEGER')
+
+
+def _rate_limits(c):
+    # Token buckets shared by every worker when CHAT_RATE_LIMIT_SHARED is set
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def _catalog_version(c):
+    # Bumped by any change to products, so caches of the catalog can tell when to reload
+    c.execute('CREATE TABLE IF NOT EXISTS catalog_version (version INTEGER NOT NULL)')
+    c.execute('INSERT INTO catalog_version (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM catalog_version)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS products_version_{event.lower()} AFTER {event} ON products BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END
+        ''')
+
+
+def _cart_versions(c):
+    # Bumped with every cart change, so cached carts can be checked against the database
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cart_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+
+
+def _order_versions(c):
+    # Bumped with every new order and every status change a user can see, so
+    # cached order pages can be checked against the database from any worker
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS order_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    # Moving to delivered changes nothing shown: old pending orders already show as delivered
+    for name, event, condition in [
+            ('insert', 'INSERT', ''),
+            ('status', 'UPDATE OF status',
+             "WHEN NEW.status IS NOT OLD.status AND NEW.status != 'delivered'")]:
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS orders_version_{name} AFTER {event} ON orders {condition} BEGIN
+                INSERT INTO order_versions (user_id, version) VALUES (NEW.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+        ''')
+
+
+# (version, description, function); append only, never renumber
+MIGRATIONS = [
+    (1, 'base tables', _base_tables),
+    (2, 'product search index', _product_search),
+    (3, 'user_addresses table', _user_addresses),
+    (4, 'hot-path indexes', _hot_path_indexes),
+    (5, 'cart_items table', _cart_items),
+    (6, 'order idempotency keys', _order_idempotency_keys),
+    (7, 'order summary columns', _order_summaries),
+    (8, 'rate_limits table', _rate_limits),
+    (9, 'catalog version triggers', _catalog_version),
+    (10, 'cart_versions table', _cart_versions),
+    (11, 'order version triggers', _order_versions),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration, each in its own transaction; returns the versions applied"""
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            if version > schema_version(conn):
+                apply(c)
+                c.execute(f'PRAGMA user_version = {version:d}')
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations.')
+    parser.add_argument('--database', default=db.DEFAULT_DATABASE)
+    parser.add_argument('--status', action='store_true', help='show the schema version and exit')
+    args = parser.parse_args()
+
+    with db.connection(args.database) as conn:
+        current = schema_version(conn)
+        if args.status:
+            pending = [m for m in MIGRATIONS if m[0] > current]
+            print(f'{args.database}: schema version {current} of {SCHEMA_VERSION}')
+            for version, description, _ in pending:
+                print(f'  pending {version}: {description}')
+            return
+
+        applied = migrate(conn)
+        for version, description, _ in MIGRATIONS:
+            if version in applied:
+                print(f'Applied {version}: {description}')
+        print(f'{args.database}: schema version {schema_version(conn)}')
+
+
+if __name__ == '__main__':
+    main()
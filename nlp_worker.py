@@ -0,0 +1,63 @@
+import threading
+
+from batch_worker import BatchWorker
+
+
+class NLPUnavailable(Exception):
+    """The NLP worker's queue is full or a message was not processed in time"""
+
+
+class NLPWorker(BatchWorker):
+    """Runs spaCy on a dedicated thread so request threads only wait on a future.
+
+    Messages that arrive within `wait` seconds of each other are processed
+    together with nlp.pipe, up to batch_size at a time. The queue is bounded:
+    when it is full, vector() fails fast with NLPUnavailable instead of piling
+    up work behind a busy model.
+    """
+
+    thread_name = 'nlp-worker'
+    busy_error = NLPUnavailable
+    full_message = 'NLP queue is full'
+    timeout_message = 'Timed out waiting for the NLP worker'
+
+    def __init__(self, load_nlp, batch_size=16, wait=0.005, queue_size=256, timeout=5.0):
+        super().__init__(batch_size, wait, queue_size, timeout)
+        self.load_nlp = load_nlp  # Called on the worker thread to get the pipeline
+        self._ready = threading.Event()
+        self._nlp = None
+        self._load_error = None
+
+    def submit(self, text):
+        """Queue text for processing; the future resolves to its document vector"""
+        return super().submit(text)
+
+    def vector(self, text, timeout=None):
+        """Document vector for text, waiting at most timeout seconds once the model is loaded"""
+        future = self.submit(text)
+        # Loading the model is a one-off cost that is not counted against the timeout
+        self._ready.wait()
+        return self.result(future, timeout)
+
+    def prepare(self):
+        try:
+            self._nlp = self.load_nlp()
+        except Exception as e:
+            self._load_error = e
+        finally:
+            self._ready.set()
+
+    def process(self, batch):
+        if self._nlp is None:
+            for _, future in batch:
+                future.set_exception(self._load_error)
+            return
+
+        try:
+            docs = self._nlp.pipe([text for text, _ in batch], batch_size=len(batch))
+            for (_, future), doc in zip(batch, docs):
+                future.set_result(doc.vector)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
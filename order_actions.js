@@ -1,9 +1,15 @@
 const axios = require('axios');
 
+// The store's API_KEY, which lets this integration act for the user it is given
+const api = axios.create({
+    baseURL: 'http://127.0.0.1:5000/api',
+    headers: { Authorization: `Bearer ${process.env.ECOMMERCE_API_KEY}` },
+});
+
 // Place an order
 async function placeOrder(event, product, quantity, userId) {
     try {
-        const response = await axios.post('http://127.0.0.1:5000/api/place_order', {
+        const response = await api.post('/place_order', {
             user_id: userId,
             product: product,
             quantity: quantity,
@@ -17,7 +23,7 @@ async function placeOrder(event, product, quantity, userId) {
 // Cancel an order
 async function cancelOrder(event, orderId, userId) {
     try {
-        const response = await axios.post('http://127.0.0.1:5000/api/cancel_order', {
+        const response = await api.post('/cancel_order', {
             user_id: userId,
             order_id: orderId,
         });
@@ -30,7 +36,7 @@ async function cancelOrder(event, orderId, userId) {
 // View orders
 async function viewOrders(event, userId) {
     try {
-        const response = await axios.get(`http://127.0.0.1:5000/api/view_orders`, {
+        const response = await api.get('/view_orders', {
             params: { user_id: userId },
         });
         return response.data;
@@ -0,0 +1,172 @@
+from cart_pricing import MAX_IDS_PER_QUERY
+from order_status import effective_status
+
+DEFAULT_PAGE_SIZE = 20
+
+
+def encode_cursor(order):
+    """Opaque 'next page' cursor pointing just past an (id, ..., created_at) order row"""
+    return f"{order[3]},{order[0]}"
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor, or None for the first page or a malformed cursor"""
+    if not cursor:
+        return None
+    created_at, _, order_id = cursor.rpartition(',')
+    if not created_at or not order_id.isdigit():
+        return None
+    return created_at, int(order_id)
+
+
+def summarize_items(items):
+    """"Name (xQty),..." for price_cart() items, as stored in orders.items_summary"""
+    return ','.join(f"{item['name']} (x{item['quantity']})" for item in items)
+
+
+def fetch_orders(conn, user_id, limit, cursor=None):
+    """One page of a user's orders, newest first, as (id, total, status, created_at, items) rows.
+
+    Keyset pagination on (created_at, id): each page is an index range scan on
+    orders(user_id, created_at) starting after the cursor, however deep the page.
+    """
+    after = decode_cursor(cursor)
+    c = conn.cursor()
+    if after:
+        c.execute(f'''
+            SELECT o.id, o.total_amount, {effective_status()}, o.created_at, o.items_summary
+            FROM orders o
+            WHERE o.user_id = ? AND (o.created_at, o.id) < (?, ?)
+            ORDER BY o.created_at DESC, o.id DESC
+            LIMIT ?
+        ''', (user_id, after[0], after[1], limit))
+    else:
+        c.execute(f'''
+            SELECT o.id, o.total_amount, {effective_status()}, o.created_at, o.items_summary
+            FROM orders o
+            WHERE o.user_id = ?
+            ORDER BY o.created_at DESC, o.id DESC
+            LIMIT ?
+        ''', (user_id, limit))
+    return c.fetchall()
+
+
+def fetch_item_summaries(conn, order_ids):
+    """Map order id -> "Name (xQty),..." built from order_items, for orders not yet backfilled"""
+    if not order_ids:
+        return {}
+    placeholders = ','.join(['?'] * len(order_ids))
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT oi.order_id, GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')')
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id IN ({placeholders})
+        GROUP BY oi.order_id
+    ''', list(order_ids))
+    return dict(c.fetchall())
+
+
+def fetch_order_page(conn, user_id, page_size=DEFAULT_PAGE_SIZE, cursor=None):
+    """(orders, next_cursor) for the order history page.
+
+    Orders are (id, total, status, created_at, items) rows; next_cursor is
+    None on the last page.
+    """
+    # One extra row tells us whether another page exists
+    rows = fetch_orders(conn, user_id, page_size + 1, cursor)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    # Orders from before items_summary existed, until they are backfilled
+    missing = fetch_item_summaries(conn, [row[0] for row in rows if row[4] is None])
+    orders = [row if row[4] is not None else row[:4] + (missing.get(row[0]),) for row in rows]
+    next_cursor = encode_cursor(rows[-1]) if has_more else None
+    return orders, next_cursor
+
+
+def fetch_order(conn, order_id, user_id):
+    """(id, total, status, shipping_address, created_at, items) for one of user_id's orders, or None"""
+    row = conn.execute(f'''
+        SELECT o.id, o.total_amount, {effective_status()}, o.shipping_address, o.created_at, o.items_summary
+        FROM orders o
+        WHERE o.id = ? AND o.user_id = ?
+    ''', (order_id, user_id)).fetchone()
+    if row is None or row[5] is not None:
+        return row
+    return row[:5] + (fetch_item_summaries(conn, [order_id]).get(order_id),)
+
+
+def backfill_summaries(conn, batch_size=1000):
+    """Fill items_summary and item_count for orders placed before they existed.
+
+    Commits every batch_size orders, so checkouts are never held up for long.
+    Returns the number of orders filled.
+    """
+    filled = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in conn.execute(
+            'SELECT id FROM orders WHERE id > ? AND items_summary IS NULL ORDER BY id LIMIT ?',
+            (last_id, batch_size))]
+        if not ids:
+            return filled
+        last_id = ids[-1]
+        # An order with no items left gets an empty summary, so it is not revisited
+        conn.execute('''
+            UPDATE orders
+            SET items_summary = COALESCE((
+                    SELECT GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')')
+                    FROM order_items oi
+                    JOIN products p ON oi.product_id = p.id
+                    WHERE oi.order_id = orders.id), ''),
+                item_count = (SELECT COALESCE(SUM(oi.quantity), 0)
+                              FROM order_items oi WHERE oi.order_id = orders.id)
+            WHERE id BETWEEN ? AND ? AND items_summary IS NULL
+        ''', (ids[0], last_id))
+        conn.commit()
+        filled += len(ids)
+
+
+def _chunks(ids):
+    ids = list(dict.fromkeys(ids))
+    for start in range(0, len(ids), MAX_IDS_PER_QUERY):
+        yield ids[start:start + MAX_IDS_PER_QUERY]
+
+
+def fetch_orders_by_id(conn, order_ids, user_id=None):
+    """(id, user_id, total, status, shipping_address, created_at) rows for order_ids, in id order.
+
+    Ids that do not exist, or belong to someone other than user_id when it is
+    given, are left out.
+    """
+    rows = []
+    c = conn.cursor()
+    for chunk in _chunks(order_ids):
+        placeholders = ','.join(['?'] * len(chunk))
+        owner = '' if user_id is None else 'AND o.user_id = ?'
+        c.execute(f'''
+            SELECT o.id, o.user_id, o.total_amount, {effective_status()}, o.shipping_address, o.created_at
+            FROM orders o
+            WHERE o.id IN ({placeholders}) {owner}
+        ''', chunk + ([] if user_id is None else [user_id]))
+        rows.extend(c.fetchall())
+    return sorted(rows)
+
+
+def fetch_order_items(conn, order_ids):
+    """Map order id -> [(product_id, name, quantity, price)] for the given orders"""
+    items = {}
+    c = conn.cursor()
+    for chunk in _chunks(order_ids):
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'''
+            SELECT oi.order_id, oi.product_id, p.name, oi.quantity, oi.price_at_time
+            FROM order_items oi
+            LEFT JOIN products p ON oi.product_id = p.id
+            WHERE oi.order_id IN ({placeholders})
+            ORDER BY oi.order_id, oi.id
+        ''', chunk)
+        for order_id, *item in c.fetchall():
+            items.setdefault(order_id, []).append(tuple(item))
+    return items
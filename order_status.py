@@ -0,0 +1,153 @@
+import calendar
+import threading
+import time
+
+import db
+from cart_pricing import MAX_IDS_PER_QUERY
+
+# Pending orders count as delivered once they are this old
+DELIVERY_HOURS = 24
+DELIVERY_DELAY = f'-{DELIVERY_HOURS} hours'
+
+
+def effective_status(alias='o'):
+    """SQL expression for an order's status as of now, including pending
+    orders that are old enough to be delivered but not swept yet"""
+    prefix = f'{alias}.' if alias else ''
+    return (f"CASE WHEN {prefix}status = 'pending' "
+            f"AND {prefix}created_at <= datetime('now', '{DELIVERY_DELAY}') "
+            f"THEN 'delivered' ELSE {prefix}status END")
+
+
+# The order lifecycle: status -> {status it may move to: SQL condition the row
+# must also meet}. Each transition is one conditional UPDATE on these, so a
+# transition that lost a race (or was never allowed) changes no rows.
+TRANSITIONS = {
+    'pending': {
+        'delivered': f"created_at <= datetime('now', '{DELIVERY_DELAY}')",
+        'cancelled': f"created_at > datetime('now', '{DELIVERY_DELAY}')",
+    },
+}
+
+# (effective status, target) -> why an order in that status cannot move
+REFUSALS = {
+    ('delivered', 'cancelled'): "Order cannot be cancelled as it's been more than 24 hours",
+    ('cancelled', 'cancelled'): "Order is already cancelled",
+}
+
+
+def allowed(target, by_id=False):
+    """SQL condition for an orders row that may move to target now.
+
+    by_id is for statements that pick orders by id: '+status' stops SQLite
+    walking every recent pending order through the (status, created_at) index.
+    """
+    status = '+status' if by_id else 'status'
+    conditions = [f"({status} = '{source}' AND {targets[target]})"
+                  for source, targets in TRANSITIONS.items() if target in targets]
+    if not conditions:
+        raise ValueError(f"No order can move to {target!r}")
+    return ' OR '.join(conditions)
+
+
+def transition(conn, order_ids, target, user_id=None):
+    """Move every order in order_ids that is allowed to target, limited to
+    user_id's orders when given; returns the ids that moved.
+
+    One conditional UPDATE per MAX_IDS_PER_QUERY ids, all in one transaction.
+    """
+    ids = list(dict.fromkeys(order_ids))
+    moved = []
+    c = conn.cursor()
+    try:
+        for start in range(0, len(ids), MAX_IDS_PER_QUERY):
+            chunk = ids[start:start + MAX_IDS_PER_QUERY]
+            placeholders = ','.join(['?'] * len(chunk))
+            owner = '' if user_id is None else 'AND user_id = ?'
+            c.execute(f'''
+                UPDATE orders
+                SET status = ?
+                WHERE id IN ({placeholders}) {owner}
+                  AND ({allowed(target, by_id=True)})
+                RETURNING id
+            ''', [target] + chunk + ([] if user_id is None else [user_id]))
+            moved.extend(row[0] for row in c.fetchall())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return sorted(moved)
+
+
+def transition_all(conn, target):
+    """Move every order allowed to target in one statement; returns the count"""
+    c = conn.cursor()
+    c.execute(f'UPDATE orders SET status = ? WHERE {allowed(target)}', (target,))
+    conn.commit()
+    return c.rowcount
+
+
+def refusal(conn, order_id, user_id, target):
+    """Why the user's order did not move to target, looked up after the transition failed"""
+    row = conn.execute(f'''
+        SELECT {effective_status(None)} FROM orders WHERE id = ? AND user_id = ?
+    ''', (order_id, user_id)).fetchone()
+    if row is None:
+        return "Order not found"
+    return REFUSALS.get((row[0], target), f"Order is {row[0]} and cannot be {target}")
+
+
+def sweep_delivered(conn):
+    """Promote every eligible pending order to delivered in one statement; returns the count"""
+    return transition_all(conn, 'delivered')
+
+
+def cancel_order(conn, order_id, user_id):
+    """Cancel the user's order if it is still pending and not yet delivered; returns whether it was.
+
+    A single conditional UPDATE, so two requests racing to cancel, or a cancel
+    racing the sweeper, cannot both win.
+    """
+    return bool(transition(conn, [order_id], 'cancelled', user_id))
+
+
+def cancel_orders(conn, order_ids, user_id=None):
+    """Cancel every order in order_ids that can still be cancelled; returns the ids that were"""
+    return transition(conn, order_ids, 'cancelled', user_id)
+
+
+def delivered_at(created_at):
+    """Wall-clock time a pending order created at created_at (UTC) starts showing as delivered"""
+    return calendar.timegm(time.strptime(created_at, '%Y-%m-%d %H:%M:%S')) + DELIVERY_HOURS * 3600
+
+
+class OrderStatusSweeper:
+    """Background thread that runs sweep_delivered every interval seconds"""
+
+    def __init__(self, database=None, interval=300):
+        self.database = database
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        with db.connection(self.database) as conn:
+            return sweep_delivered(conn)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Order status sweep failed: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="order-status-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
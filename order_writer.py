@@ -0,0 +1,142 @@
+import sqlite3
+from collections import namedtuple
+
+import db
+from batch_worker import BatchWorker
+from order_history import summarize_items
+
+# A priced, validated checkout. items are price_cart() items; saved_address is
+# an optional (full_name, street, city, state, zip_code, phone) tuple to keep
+# in user_addresses.
+Order = namedtuple('Order', 'user_id items total shipping_address idempotency_key saved_address',
+                   defaults=(None, None))
+
+
+class OrderWriterBusy(Exception):
+    """The order queue is full or the order was not committed in time"""
+
+
+def find_order(conn, user_id, idempotency_key):
+    """Id of the order already placed with this idempotency key, if any"""
+    if not idempotency_key:
+        return None
+    row = conn.execute('SELECT id FROM orders WHERE user_id = ? AND idempotency_key = ?',
+                       (user_id, idempotency_key)).fetchone()
+    return row[0] if row else None
+
+
+def insert_order(c, order):
+    """Write one order, its items and any saved address; returns the order id.
+
+    Runs in the caller's transaction. An order whose idempotency key was
+    already used returns the existing order's id instead of a new one.
+    """
+    existing = find_order(c.connection, order.user_id, order.idempotency_key)
+    if existing:
+        return existing
+
+    if order.saved_address:
+        c.execute('''
+            INSERT INTO user_addresses
+            (user_id, full_name, street, city, state, zip_code, phone)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (order.user_id,) + tuple(order.saved_address))
+
+    # Orders do not change after checkout (but for status), so their item list is stored with them
+    c.execute('''
+        INSERT INTO orders
+        (user_id, total_amount, status, shipping_address, idempotency_key, items_summary, item_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (order.user_id, order.total, 'pending', order.shipping_address, order.idempotency_key,
+          summarize_items(order.items), sum(item['quantity'] for item in order.items)))
+    order_id = c.lastrowid
+
+    c.executemany('''
+        INSERT INTO order_items
+        (order_id, product_id, quantity, price_at_time)
+        VALUES (?, ?, ?, ?)
+    ''', [(order_id, item['id'], item['quantity'], item['price']) for item in order.items])
+    return order_id
+
+
+class OrderWriter(BatchWorker):
+    """Commits orders from a queue on one writer thread, several per transaction.
+
+    Instead of every checkout request taking SQLite's write lock for its own
+    transaction, requests queue their order and wait on a future for its id.
+    The writer drains whatever arrived within `wait` seconds (up to batch_size
+    orders), writes each under its own savepoint so one bad order does not
+    fail the rest, and commits the group once.
+    """
+
+    thread_name = 'order-writer'
+    busy_error = OrderWriterBusy
+    full_message = 'Order queue is full'
+    timeout_message = 'Timed out waiting for the order to be saved'
+
+    def __init__(self, database=None, batch_size=32, wait=0.002, queue_size=1024, timeout=10.0):
+        super().__init__(batch_size, wait, queue_size, timeout)
+        self.database = database
+        self._pool = None
+        self.batches = 0
+        self.orders = 0
+
+    def submit(self, order):
+        """Queue an order; the future resolves to its order id"""
+        return super().submit(order)
+
+    def place(self, order, timeout=None):
+        """Order id for order, waiting at most timeout seconds for it to be committed.
+
+        An order that timed out after the writer started on it is still
+        committed, and a retry with the same idempotency key finds it.
+        """
+        return self.result(self.submit(order), timeout)
+
+    def _write(self, conn, batch):
+        """Write a batch in one transaction; returns [(future, order_id or exception)]"""
+        results = []
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            for order, future in batch:
+                c.execute('SAVEPOINT order_write')
+                try:
+                    results.append((future, insert_order(c, order)))
+                except sqlite3.IntegrityError as e:
+                    c.execute('ROLLBACK TO order_write')
+                    # Another process committed this idempotency key first
+                    existing = find_order(conn, order.user_id, order.idempotency_key)
+                    results.append((future, existing or e))
+                except Exception as e:
+                    c.execute('ROLLBACK TO order_write')
+                    results.append((future, e))
+                c.execute('RELEASE order_write')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return [(future, e) for _, future in batch]
+        return results
+
+    def prepare(self):
+        self._pool = db.get_pool(self.database)
+
+    def process(self, batch):
+        try:
+            conn = self._pool.acquire()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        try:
+            results = self._write(conn, batch)
+        finally:
+            self._pool.release(conn)
+
+        self.batches += 1
+        for future, result in results:
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                self.orders += 1
+                future.set_result(result)
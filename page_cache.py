@@ -0,0 +1,95 @@
+"""Rendered pages kept in memory, served with strong ETags and Last-Modified.
+
+Views key a page by the versions of the data it shows: the catalog version
+for the product grid, the user's order version for order pages. A repeat
+view is answered from the cache, or with 304 Not Modified when the client
+already has it, without querying SQLite or rendering a template.
+
+Order versions live in the order_versions table, bumped by triggers in the
+same transaction as every order insert or status change, so a page cached
+by one worker process is never served after another process changes it.
+"""
+import hashlib
+import time
+from collections import namedtuple
+
+from flask import Response, request, session
+
+import db
+from lru import LRUCache
+
+# body: rendered HTML; expires: wall-clock time after which it must be re-rendered
+Page = namedtuple('Page', 'body etag last_modified expires')
+
+
+class OrderVersions:
+    """Per-user order versions, read from the order_versions table"""
+
+    def __init__(self, database=None):
+        self.database = database
+
+    def get(self, user_id):
+        with db.connection(self.database) as conn:
+            row = conn.execute('SELECT version FROM order_versions WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        return row[0] if row else 0
+
+
+order_versions = OrderVersions()
+
+
+class PageCache:
+    """Thread-safe LRU cache of rendered pages, bounded to max_size entries"""
+
+    def __init__(self, max_size=1000, ttl=300):
+        self.ttl = ttl
+        # Wall-clock expiry: render() reports when a page goes stale as a time.time()
+        self._pages = LRUCache(max_size, ttl, clock=time.time)
+
+    def get(self, key):
+        return self._pages.get(key)
+
+    def put(self, key, body, expires=None):
+        """Cache body until expires (default: ttl from now); returns the Page"""
+        now = time.time()
+        expires = now + self.ttl if expires is None else min(expires, now + self.ttl)
+        page = Page(body, hashlib.sha256(body.encode()).hexdigest()[:32], int(now), expires)
+        self._pages.put(key, page, expires)
+        return page
+
+    def clear(self):
+        self._pages.clear()
+
+    def stats(self):
+        return self._pages.stats()
+
+
+def respond(page):
+    """The page as a response, or 304 when the request's validators match it"""
+    response = Response(page.body, content_type='text/html; charset=utf-8')
+    response.set_etag(page.etag)
+    response.last_modified = page.last_modified
+    # Per-user pages: browsers may store them but must revalidate every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def cached_page(cache, key, render):
+    """Serve the page cached under key, rendering it on a miss.
+
+    render() returns (html, expires), expires being a wall-clock time or None;
+    anything else (a redirect, say) is returned as is and not cached.
+    """
+    # Flashed messages are shown once, so a page carrying them is never cached
+    if session.get('_flashes'):
+        result = render()
+        return result[0] if isinstance(result, tuple) else result
+
+    page = cache.get(key)
+    if page is None:
+        result = render()
+        if not isinstance(result, tuple):
+            return result
+        page = cache.put(key, *result)
+    return respond(page)
@@ -0,0 +1,145 @@
+"""Admission control for expensive endpoints: per-client token buckets and a
+concurrency gate.
+
+A client (user id, or IP address when logged out) gets `burst` requests at
+once and `rate` more per second after that. acquire() returns 0 when the
+request may go ahead, otherwise how many seconds until it could, for a
+Retry-After header. The in-memory limiter counts per process; the SQLite one
+keeps the buckets in the rate_limits table so every worker shares them.
+
+The gate bounds how many requests run a code path at once; requests beyond
+that are turned away instead of queueing behind it.
+"""
+import threading
+import time
+
+import db
+from lru import LRUCache
+
+
+class MemoryRateLimiter:
+    """Token buckets for the clients this process has seen, at most max_keys of them"""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate  # Tokens per second; 0 turns limiting off
+        self.burst = burst
+        self.max_keys = max_keys
+        # Least recently seen evicted first; a forgotten client starts again with a full bucket
+        self._buckets = LRUCache(max_keys)  # key -> (tokens, updated)
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, key):
+        """Take a token for key; returns 0, or the seconds until one is available"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._buckets.lock:
+            tokens, updated = self._buckets.peek(key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            if not wait:
+                tokens -= 1
+            self._buckets.put(key, (tokens, now))
+            if wait:
+                self.limited += 1
+            else:
+                self.allowed += 1
+        return wait
+
+    def stats(self):
+        return {'allowed': self.allowed, 'limited': self.limited, 'clients': len(self._buckets)}
+
+
+class SQLiteRateLimiter:
+    """Token buckets in the rate_limits table, shared by every worker process.
+
+    Taking a token is one UPSERT that refills and decrements the bucket only
+    if a token is left, so concurrent requests from any worker cannot both
+    spend the last one.
+    """
+
+    def __init__(self, rate, burst, database=None, prune_every=10000):
+        self.rate = rate
+        self.burst = burst
+        self.database = database
+        self.prune_every = prune_every
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, key):
+        """Take a token for key; returns 0, or the seconds until one is available"""
+        if self.rate <= 0:
+            return 0
+        # Wall-clock time: buckets are shared between processes
+        now = time.time()
+        with db.connection(self.database) as conn:
+            c = conn.cursor()
+            try:
+                c.execute('''
+                    INSERT INTO rate_limits (key, tokens, updated)
+                    VALUES (:key, :burst - 1, :now)
+                    ON CONFLICT (key) DO UPDATE
+                    SET tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now
+                    WHERE MIN(:burst, tokens + (:now - updated) * :rate) >= 1
+                    RETURNING tokens
+                ''', {'key': key, 'burst': self.burst, 'now': now, 'rate': self.rate})
+                taken = c.fetchone() is not None
+                if not taken:
+                    c.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,))
+                    tokens, updated = c.fetchone()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        if taken:
+            self.allowed += 1
+            if self.allowed % self.prune_every == 0:
+                self.prune()
+            return 0
+        self.limited += 1
+        return max(0.0, (1 - (tokens + (now - updated) * self.rate)) / self.rate)
+
+    def prune(self):
+        """Drop buckets that have refilled completely; they are the same as no row"""
+        if self.rate <= 0:
+            return 0
+        with db.connection(self.database) as conn:
+            c = conn.execute('DELETE FROM rate_limits WHERE updated < ?',
+                             (time.time() - self.burst / self.rate,))
+            conn.commit()
+            return c.rowcount
+
+    def stats(self):
+        return {'allowed': self.allowed, 'limited': self.limited}
+
+
+def create_rate_limiter(rate, burst, shared=False, database=None):
+    """Per-process token buckets, or ones shared through SQLite when shared is set"""
+    if shared:
+        return SQLiteRateLimiter(rate, burst, database)
+    return MemoryRateLimiter(rate, burst)
+
+
+class ConcurrencyGate:
+    """At most limit callers inside at once; 0 means no limit"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self.shed = 0
+
+    def enter(self):
+        """Take a slot without waiting; returns whether one was free"""
+        if self._slots is None or self._slots.acquire(blocking=False):
+            return True
+        self.shed += 1
+        return False
+
+    def leave(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def stats(self):
+        return {'shed': self.shed, 'limit': self.limit}
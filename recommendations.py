@@ -0,0 +1,301 @@
+"""Item-to-item "bought together" recommendations from order_items.
+
+Inspect the index built from a database, or save it for the app to load:
+
+    python recommendations.py [--database ecommerce.db] [--product ID] [--output recommendations.npz]
+
+Building runs a self-join over order_items, which takes seconds on a large
+store. With RECOMMENDATIONS_INDEX pointing at a saved index (rebuilt by
+running the command above on a schedule), workers load that file instead.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+import db
+from catalog import catalog
+
+# Pairs of products bought in the same order, and in how many orders
+CO_PURCHASES = '''
+    SELECT a.product_id, b.product_id, COUNT(DISTINCT a.order_id)
+    FROM order_items a
+    JOIN order_items b ON a.order_id = b.order_id AND a.product_id <> b.product_id
+    GROUP BY a.product_id, b.product_id
+'''
+ORDER_COUNTS = 'SELECT product_id, COUNT(DISTINCT order_id) FROM order_items GROUP BY product_id'
+
+# Recommendations for a user are seeded from this many of their latest products
+HISTORY_SIZE = 20
+# Best sellers kept to fill up short recommendation lists
+POPULAR_SIZE = 50
+
+
+def _columns(rows, width):
+    """Rows of integers as width int64 arrays, one per column"""
+    if not rows:
+        return [np.zeros(0, dtype=np.int64)] * width
+    return [np.array(column, dtype=np.int64) for column in zip(*rows)]
+
+
+def user_products(conn, user_id, limit=HISTORY_SIZE):
+    """Distinct products from the user's orders, most recent first"""
+    c = conn.cursor()
+    c.execute('''
+        SELECT oi.product_id, MAX(o.created_at) AS last_bought
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.user_id = ?
+        GROUP BY oi.product_id
+        ORDER BY last_bought DESC
+        LIMIT ?
+    ''', (user_id, limit))
+    return [row[0] for row in c.fetchall()]
+
+
+class Recommender:
+    """Top-k most similar products per product, held in memory.
+
+    Similarity is co-purchase cosine: the number of orders containing both
+    products over the geometric mean of the orders containing each. refresh()
+    loads the saved index at index_path when there is one, else builds it
+    from order_items; wsgi.py runs it before forking. Once the index is older
+    than max_age seconds (0: never), or if it was never loaded, the next read
+    starts a refresh on a background thread and carries on with what it has,
+    so no request waits for a build. record_order() folds in this process's
+    checkouts as they happen, re-ranking just the products in the order.
+    """
+
+    def __init__(self, top_k=10, max_age=600.0, database=None, index_path=None):
+        self.top_k = top_k
+        self.max_age = max_age
+        self.database = database
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._pairs = {}  # product_id -> {other product_id: orders with both}
+        self._orders = {}  # product_id -> orders containing it
+        self._neighbours = {}  # product_id -> [(other product_id, score)], best first
+        self._popular = []  # product ids, most ordered first
+        self._built_at = None
+        self._index_mtime = None  # Of the saved index last loaded
+        self.build_seconds = 0.0
+
+    def configure(self, database=None, index_path=None):
+        self.database = database
+        self.index_path = index_path
+
+    def build(self, conn=None):
+        """Recompute the index from every order"""
+        start = time.perf_counter()
+        if conn is None:
+            with db.connection(self.database) as conn:
+                pairs, counts = self._query(conn)
+        else:
+            pairs, counts = self._query(conn)
+        self._install(pairs, counts)
+        self.build_seconds = time.perf_counter() - start
+
+    @staticmethod
+    def _query(conn):
+        """((a, b, orders with both) arrays, (product, orders) arrays) from order_items"""
+        c = conn.cursor()
+        c.execute(CO_PURCHASES)
+        pairs = c.fetchall()
+        c.execute(ORDER_COUNTS)
+        return _columns(pairs, 3), _columns(c.fetchall(), 2)
+
+    def _install(self, pairs, counts):
+        a, b, n = pairs
+        products, product_orders = counts
+        orders = dict(zip(products.tolist(), product_orders.tolist()))
+        neighbours = self._rank_all(a, b, n, orders)
+        by_product = {}
+        for product_id, other, count in zip(a.tolist(), b.tolist(), n.tolist()):
+            by_product.setdefault(product_id, {})[other] = count
+        popular = products[np.argsort(-product_orders, kind='stable')][:POPULAR_SIZE].tolist()
+
+        with self._lock:
+            self._pairs = by_product
+            self._orders = orders
+            self._neighbours = neighbours
+            self._popular = popular
+            self._built_at = time.monotonic()
+
+    def save(self, path):
+        """Write the index to path, replacing any earlier one in a single step"""
+        with self._lock:
+            rows = [(a, b, n) for a, others in self._pairs.items() for b, n in others.items()]
+            counts = list(self._orders.items())
+        a, b, n = _columns(rows, 3)
+        products, product_orders = _columns(counts, 2)
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as f:
+            np.savez(f, a=a, b=b, n=n, products=products, orders=product_orders)
+        os.replace(temp, path)
+
+    def load(self, path):
+        """Replace the index with one written by save()"""
+        start = time.perf_counter()
+        mtime = os.stat(path).st_mtime
+        with np.load(path) as saved:
+            self._install((saved['a'], saved['b'], saved['n']), (saved['products'], saved['orders']))
+        self._index_mtime = mtime
+        self.build_seconds = time.perf_counter() - start
+
+    def refresh(self):
+        """Load the saved index if it changed, or rebuild from the database when there is none"""
+        if self.index_path and os.path.exists(self.index_path):
+            if os.stat(self.index_path).st_mtime != self._index_mtime or self._built_at is None:
+                self.load(self.index_path)
+            else:
+                with self._lock:
+                    self._built_at = time.monotonic()
+        else:
+            self.build()
+
+    def _rank_all(self, a, b, n, orders):
+        """Top-k neighbours of every product, scoring all pairs at once"""
+        if not len(a):
+            return {}
+        counts_a = np.array([orders[product_id] for product_id in a.tolist()], dtype=float)
+        counts_b = np.array([orders[product_id] for product_id in b.tolist()], dtype=float)
+        scores = n / np.sqrt(counts_a * counts_b)
+
+        # Group by product, best score first, then keep the first top_k of each group
+        order = np.lexsort((-scores, a))
+        a, b, scores = a[order], b[order], scores[order]
+        starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+        ends = np.r_[starts[1:], len(a)]
+        neighbours = {}
+        for start, end in zip(starts, ends):
+            end = min(end, start + self.top_k)
+            neighbours[int(a[start])] = list(zip(b[start:end].tolist(), scores[start:end].tolist()))
+        return neighbours
+
+    def _rank(self, product_id):
+        others = self._pairs.get(product_id, {})
+        n = self._orders[product_id]
+        scored = [(other, count / (n * self._orders[other]) ** 0.5) for other, count in others.items()]
+        scored.sort(key=lambda pair: -pair[1])
+        return scored[:self.top_k]
+
+    def record_order(self, product_ids):
+        """Fold a newly placed order into the index.
+
+        Only the products in the order are re-ranked; other products' scores
+        against them catch up at the next rebuild.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        with self._lock:
+            if self._built_at is None:
+                return  # Built from the database, including this order, on first use
+            for product_id in product_ids:
+                self._orders[product_id] = self._orders.get(product_id, 0) + 1
+                others = self._pairs.setdefault(product_id, {})
+                for other in product_ids:
+                    if other != product_id:
+                        others[other] = others.get(other, 0) + 1
+            for product_id in product_ids:
+                self._neighbours[product_id] = self._rank(product_id)
+
+    def _is_fresh(self):
+        return (self._built_at is not None
+                and (not self.max_age or time.monotonic() - self._built_at < self.max_age))
+
+    def _ensure_built(self):
+        if self._is_fresh():
+            return
+        # One background refresh at a time; readers keep using what is there
+        if self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name="recommendations-refresh",
+                             daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Recommendation refresh failed: {str(e)}")
+        finally:
+            self._build_lock.release()
+
+    def similar(self, product_id, k=None):
+        """[(product_id, score)] most often bought with product_id"""
+        self._ensure_built()
+        return self._neighbours.get(product_id, [])[:k or self.top_k]
+
+    def recommend_for(self, product_ids, k=3):
+        """Up to k products to suggest to someone who bought product_ids"""
+        self._ensure_built()
+        bought = set(product_ids)
+        scores = {}
+        for product_id in product_ids:
+            for other, score in self._neighbours.get(product_id, ()):
+                if other not in bought:
+                    scores[other] = scores.get(other, 0.0) + score
+        ranked = sorted(scores, key=lambda other: -scores[other])[:k]
+
+        # Fill up with the best sellers the user has not bought
+        if len(ranked) < k:
+            ranked += self.best_sellers(k - len(ranked), exclude=bought.union(ranked))
+        return ranked
+
+    def best_sellers(self, k=3, exclude=()):
+        """The k most ordered products, leaving out exclude"""
+        self._ensure_built()
+        return [product_id for product_id in self._popular if product_id not in exclude][:k]
+
+    def recommend(self, conn, user_id, k=3):
+        """Up to k product ids for a user, from their most recent purchases.
+
+        Topped up with other catalog products when too few have been ordered
+        (a new store, or before the index is first built).
+        """
+        bought = user_products(conn, user_id)
+        ranked = self.recommend_for(bought, k)
+        if len(ranked) < k:
+            exclude = set(bought).union(ranked)
+            others = [product[0] for product in catalog.all() if product[0] not in exclude]
+            ranked += random.sample(others, min(k - len(ranked), len(others)))
+        return ranked
+
+    def stats(self):
+        return {
+            'products': len(self._neighbours),
+            'pairs': sum(len(others) for others in self._pairs.values()),
+            'build_seconds': self.build_seconds,
+        }
+
+
+recommender = Recommender()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the recommendation index and show what it contains.')
+    parser.add_argument('--database', default=db.DEFAULT_DATABASE)
+    parser.add_argument('--product', type=int, help='show the products most often bought with this one')
+    parser.add_argument('--output', help='save the index here, for RECOMMENDATIONS_INDEX')
+    args = parser.parse_args()
+
+    index = Recommender(max_age=0)
+    with db.connection(args.database) as conn:
+        index.build(conn)
+        names = dict(conn.execute('SELECT id, name FROM products').fetchall())
+    if args.output:
+        index.save(args.output)
+        print(f"Saved the index to {args.output}")
+
+    stats = index.stats()
+    print(f"{args.database}: {stats['products']} products, {stats['pairs']} co-purchase pairs, "
+          f"built in {stats['build_seconds'] * 1000:.1f}ms")
+    products = [args.product] if args.product else sorted(index._neighbours)
+    for product_id in products:
+        similar = ', '.join(f"{names.get(other, other)} ({score:.2f})" for other, score in index.similar(product_id))
+        print(f"  {names.get(product_id, product_id)}: {similar or '-'}")
+
+
+if __name__ == '__main__':
+    main()
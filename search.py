@@ -0,0 +1,135 @@
+import difflib
+import re
+
+# External-content FTS5 index over product names and descriptions. The
+# trigram tokenizer gives substring matching ("cake" finds "Vanilla Cake Mix")
+# and lets misspelt queries match on the trigrams they still share.
+SEARCH_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description,
+        content='products', content_rowid='id',
+        tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_fts (rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    ''',
+]
+
+# Name matches count ten times as much as description matches
+RANK = 'bm25(products_fts, 10.0, 1.0)'
+
+# Fuzzy matches scoring below this similarity to the product name are dropped
+MIN_FUZZY_RATIO = 0.6
+
+# How many index candidates are re-ranked per result requested
+CANDIDATES_PER_RESULT = 5
+
+
+def create_search_index(conn):
+    """Create the index and its sync triggers, filling it from products if new.
+    Runs in the caller's transaction."""
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")
+    exists = c.fetchone() is not None
+    for statement in SEARCH_SCHEMA:
+        c.execute(statement)
+    if not exists:
+        c.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+def _terms(query):
+    return re.sub(r'[^\w]+', ' ', query.lower()).split()
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _ranked(conn, match, limit):
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT p.*
+        FROM products_fts
+        JOIN products p ON p.id = products_fts.rowid
+        WHERE products_fts MATCH ?
+        ORDER BY {RANK}
+        LIMIT ?
+    ''', (match, limit))
+    return c.fetchall()
+
+
+def _word_hits(terms, name):
+    """How many terms start a word of the name ("cake" counts for "Cake Mix", not "Pancake Mix")"""
+    words = name.lower().split()
+    return sum(any(word.startswith(term) for word in words) for term in terms)
+
+
+def _name_similarity(terms, name):
+    """Best similarity between the query and any run of words in the name of the same length"""
+    query = ' '.join(terms)
+    words = name.lower().split()
+    size = min(len(terms), len(words)) or 1
+    return max(difflib.SequenceMatcher(None, query, ' '.join(words[i:i + size])).ratio()
+               for i in range(max(len(words) - size + 1, 1)))
+
+
+def search_products(conn, query, limit=10):
+    """Products matching query, best first.
+
+    Every term of three or more characters must appear in the name or
+    description; names where the terms start a word rank first, then bm25
+    (name-weighted) decides. If nothing matches, the query's trigrams are OR-ed together
+    and the candidates re-ranked by how closely their names match, which
+    tolerates typos such as "strawbery".
+    """
+    terms = _terms(query)
+    indexed = [term for term in terms if len(term) >= 3]
+
+    if not indexed:
+        # Trigrams cannot index one- and two-letter terms
+        if not terms:
+            return []
+        c = conn.cursor()
+        c.execute('SELECT * FROM products WHERE name LIKE ? ORDER BY id LIMIT ?',
+                  (f'%{" ".join(terms)}%', limit))
+        return c.fetchall()
+
+    candidates = _ranked(conn, ' AND '.join(_quote(term) for term in indexed),
+                         limit * CANDIDATES_PER_RESULT)
+    if candidates:
+        # Stable sort, so bm25 order is kept between equally good names
+        candidates.sort(key=lambda product: _word_hits(indexed, product[1]), reverse=True)
+        return candidates[:limit]
+
+    trigrams = {term[i:i + 3] for term in indexed for i in range(len(term) - 2)}
+    candidates = _ranked(conn, ' OR '.join(_quote(t) for t in sorted(trigrams)),
+                         limit * CANDIDATES_PER_RESULT)
+    scored = [(_name_similarity(indexed, product[1]), product) for product in candidates]
+    scored = [item for item in scored if item[0] >= MIN_FUZZY_RATIO]
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [product for _, product in scored[:limit]]
+
+
+def best_match(conn, query):
+    """The single best product for query, or None"""
+    results = search_products(conn, query, limit=1)
+    return results[0] if results else None
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from catalog import catalog  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A migrated, empty database, used by code that does not name one"""
+    path = str(tmp_path / 'shop.db')
+    with db.connection(path) as conn:
+        migrations.migrate(conn)
+    monkeypatch.setattr(db, 'DEFAULT_DATABASE', path)
+    # Module-level caches must not carry another test's rows over
+    catalog.invalidate()
+    return path
+
+
+@pytest.fixture
+def app(database):
+    """The app on the test database, with the sample products"""
+    from app import create_app, init_db
+    init_db(database)
+    app = create_app({'DATABASE': database, 'SECRET_KEY': 'test', 'TESTING': True})
+    yield app
+    app.extensions['shop'].order_writer.stop()
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as a new user"""
+    client = app.test_client()
+    client.post('/signup', data={'email': 'test@example.com', 'username': 'test', 'password': 'secret'})
+    client.post('/login', data={'email': 'test@example.com', 'password': 'secret'})
+    return client
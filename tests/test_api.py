@@ -0,0 +1,82 @@
+import db
+
+KEY = 'test-api-key'
+AUTH = {'Authorization': f'Bearer {KEY}'}
+
+
+def add_order(database, user_id):
+    with db.connection(database) as conn:
+        order_id = conn.execute("INSERT INTO orders (user_id, total_amount, status, shipping_address) "
+                                "VALUES (?, 10, 'pending', 'x')", (user_id,)).lastrowid
+        conn.commit()
+    return order_id
+
+
+def order_status(database, order_id):
+    with db.connection(database) as conn:
+        return conn.execute('SELECT status FROM orders WHERE id = ?', (order_id,)).fetchone()[0]
+
+
+def other_user(app):
+    """Sign up a second user; the client fixture's user is id 1, so this one is 2"""
+    app.test_client().post('/signup', data={'email': 'other@example.com', 'username': 'other',
+                                            'password': 'secret'})
+    return 2
+
+
+def test_api_key_reads_any_users_orders(app, client, database):
+    app.config['API_KEY'] = KEY
+    other = other_user(app)
+    order_id = add_order(database, other)
+
+    response = app.test_client().get(f'/api/v1/orders?user_id={other}&fields=id,user_id', headers=AUTH)
+    assert response.status_code == 200
+    assert response.get_json()['orders'] == [{'id': order_id, 'user_id': other}]
+
+
+def test_session_user_is_held_to_their_own_orders(app, client, database):
+    other = other_user(app)
+    theirs, mine = add_order(database, other), add_order(database, 1)
+
+    assert client.get(f'/api/v1/orders?user_id={other}').status_code == 403
+    assert [order['id'] for order in client.get('/api/v1/orders').get_json()['orders']] == [mine]
+
+    lookup = client.post('/api/v1/orders/lookup', json={'order_ids': [theirs, mine], 'fields': ['id']})
+    assert lookup.get_json() == {'orders': [{'id': mine}], 'missing': [theirs]}
+
+    cancel = client.post('/api/v1/orders/cancel', json={'order_ids': [theirs]})
+    assert cancel.get_json() == {'cancelled': [], 'not_cancelled': [{'order_id': theirs, 'status': 'not_found'}]}
+    assert order_status(database, theirs) == 'pending'
+
+
+def test_requests_without_a_session_or_the_key_are_refused(app, database):
+    app.config['API_KEY'] = KEY
+    anonymous = app.test_client()
+    for headers in [{}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'Bearer é'}]:
+        response = anonymous.get('/api/view_orders?user_id=1', headers=headers)
+        assert response.status_code == 401
+        assert response.get_json() == {'error': 'Log in or send the API key'}
+
+
+def test_batch_create_and_cancel(app, client, database):
+    app.config['API_KEY'] = KEY
+    other = other_user(app)
+    api = app.test_client()
+
+    created = api.post('/api/v1/orders', headers=AUTH, json={'orders': [
+        {'user_id': 1, 'items': [{'product_id': 1, 'quantity': 2}], 'shipping_address': 'x'},
+        {'user_id': other, 'items': [{'product_id': 2}], 'shipping_address': 'y'},
+        {'user_id': 99, 'items': [{'product_id': 1}], 'shipping_address': 'z'},
+        {'user_id': 1, 'items': [], 'shipping_address': 'x'},
+    ]}).get_json()['results']
+    assert [sorted(result) for result in created[:2]] == [['order_id', 'total'], ['order_id', 'total']]
+    assert created[2] == {'error': 'Unknown user'}
+    assert 'error' in created[3]
+
+    order_ids = [result['order_id'] for result in created[:2]]
+    cancelled = api.post('/api/v1/orders/cancel', headers=AUTH, json={'order_ids': order_ids + [order_ids[0]]})
+    assert cancelled.get_json() == {'cancelled': sorted(order_ids), 'not_cancelled': []}
+    assert [order_status(database, order_id) for order_id in order_ids] == ['cancelled', 'cancelled']
+
+    again = api.post('/api/v1/orders/cancel', headers=AUTH, json={'order_ids': order_ids[:1]})
+    assert again.get_json()['not_cancelled'] == [{'order_id': order_ids[0], 'status': 'cancelled'}]
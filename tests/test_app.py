@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+
+from flask import Flask
+
+from app import load_secret_key
+
+
+def test_workers_racing_for_the_secret_key_all_read_the_same_one(tmp_path, monkeypatch):
+    urandom = os.urandom
+
+    def slow_urandom(n):
+        time.sleep(0.05)  # Widens the window between creating the key file and filling it
+        return urandom(n)
+
+    monkeypatch.setattr(os, 'urandom', slow_urandom)
+    apps = [Flask('app', instance_path=str(tmp_path / 'instance')) for _ in range(16)]
+    start = threading.Barrier(len(apps))
+    keys = [None] * len(apps)
+
+    def boot(n):
+        start.wait()
+        keys[n] = load_secret_key(apps[n])
+
+    threads = [threading.Thread(target=boot, args=(n,)) for n in range(len(apps))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(keys[0]) == 32
+    assert set(keys) == {keys[0]}
+    assert os.listdir(tmp_path / 'instance') == ['secret_key']
+
+
+def chat_statuses(app, addresses):
+    """Status of one logged-out chat message from each address, via a proxy on 127.0.0.1"""
+    client = app.test_client()
+    return [client.post('/chatbot', json={'message': 'hi'},
+                        headers={'X-Forwarded-For': address}).status_code
+            for address in addresses]
+
+
+def test_logged_out_clients_are_limited_by_their_forwarded_address(database):
+    from app import create_app
+    config = {'DATABASE': database, 'SECRET_KEY': 'test', 'TESTING': True,
+              'CHAT_RATE_LIMIT': 1, 'CHAT_RATE_BURST': 1}
+
+    behind_proxy = create_app(dict(config, PROXY_FIX_X_FOR=1))
+    assert chat_statuses(behind_proxy, ['203.0.113.1', '203.0.113.2', '203.0.113.1']) == [200, 200, 429]
+    behind_proxy.extensions['shop'].order_writer.stop()
+
+    # Not trusted: a client cannot dodge its limit by sending its own header
+    direct = create_app(dict(config, PROXY_FIX_X_FOR=0))
+    assert chat_statuses(direct, ['203.0.113.1', '203.0.113.2']) == [200, 429]
+    direct.extensions['shop'].order_writer.stop()
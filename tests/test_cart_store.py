@@ -0,0 +1,43 @@
+import db
+from cart_store import CachedCartStore, SQLiteCartStore
+
+
+def two_workers(database):
+    """Two processes' cart stores: separate caches over one database"""
+    with db.connection(database) as conn:
+        conn.executemany('INSERT INTO products (name, description, price, image) VALUES (?, ?, ?, ?)',
+                         [('Idli Mix', 'd', 50, 'i.png'), ('Dosa Mix', 'd', 60, 'd.png')])
+        conn.execute("INSERT INTO users (email, username, password) VALUES ('a@x', 'a', 'p')")
+        conn.commit()
+    return (CachedCartStore(SQLiteCartStore(database)), CachedCartStore(SQLiteCartStore(database)))
+
+
+def test_cached_cart_sees_another_workers_change(database):
+    a, b = two_workers(database)
+    a.add(1, 1)
+    assert a.get(1) == {1: 1}
+
+    b.add(1, 2)
+    assert a.get(1) == {1: 1, 2: 1}
+    assert b.get(1) == {1: 1, 2: 1}
+
+
+def test_own_writes_keep_the_cache_current(database):
+    a, _ = two_workers(database)
+    a.add(1, 1)
+    a.get(1)
+    a.add(1, 1)
+    a.add(1, 2)
+    assert a.get(1) == {1: 2, 2: 1}
+    assert a.stats()['hits'] >= 1
+
+
+def test_checkout_clears_only_the_ordered_lines(database):
+    a, b = two_workers(database)
+    a.add(1, 1)
+    ordered = a.get(1)
+
+    b.add(1, 2)  # Added while the order was being placed
+    a.clear(1, ordered=ordered)
+    assert a.get(1) == {2: 1}
+    assert b.get(1) == {2: 1}
@@ -0,0 +1,53 @@
+import sys
+import threading
+
+import db
+from catalog import ProductCatalog
+
+
+def test_catalog_reloads_when_a_product_is_renamed(database):
+    with db.connection(database) as conn:
+        conn.execute("INSERT INTO products (name, description, price, image) VALUES ('Idli Mix', 'd', 50, 'i.png')")
+        conn.commit()
+
+    catalog = ProductCatalog(check_interval=0)
+    assert catalog.get(1)[1] == 'Idli Mix'
+    version = catalog.version
+
+    # Same row count, max id and prices: only the name changes
+    with db.connection(database) as conn:
+        conn.execute("UPDATE products SET name = 'Soft Idli Mix' WHERE id = 1")
+        conn.commit()
+    assert catalog.get(1)[1] == 'Soft Idli Mix'
+    assert catalog.version == version + 1
+
+    # Nothing changed since: no reload
+    catalog.all()
+    assert catalog.version == version + 1
+
+
+def test_reads_racing_invalidate_always_see_a_whole_catalog(database):
+    with db.connection(database) as conn:
+        conn.executemany('INSERT INTO products (name, description, price, image) VALUES (?, ?, ?, ?)',
+                         [(f'Mix {n}', 'd', 10, 'i.png') for n in range(50)])
+        conn.commit()
+    catalog = ProductCatalog(check_interval=60)
+    # Switch threads as often as possible, so invalidate() lands between reads
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    stop = threading.Event()
+
+    def invalidate():
+        while not stop.is_set():
+            catalog.invalidate()
+
+    thread = threading.Thread(target=invalidate)
+    thread.start()
+    try:
+        for _ in range(20000):
+            assert len(catalog.all()) == 50
+            assert catalog.find_by_name('mix 49')[1] == 'Mix 49'
+    finally:
+        sys.setswitchinterval(interval)
+        stop.set()
+        thread.join()
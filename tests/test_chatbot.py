@@ -0,0 +1,87 @@
+import sys
+import threading
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+import db
+from chatbot import Chatbot
+
+
+class FakeNLP:
+    """A stand-in spaCy pipeline: a text's vector is the mean of fixed random word vectors"""
+
+    def vector(self, text):
+        words = [np.random.default_rng(zlib.crc32(word.encode())).standard_normal(32)
+                 for word in text.lower().split()]
+        return np.mean(words, axis=0).astype(np.float32)
+
+    def __call__(self, text):
+        return SimpleNamespace(vector=self.vector(text))
+
+    def pipe(self, texts, batch_size=None):
+        return [self(text) for text in texts]
+
+
+def use_fake_nlp(chatbot):
+    nlp = FakeNLP()
+    chatbot.build_keyword_vectors(nlp)
+    chatbot._nlp = nlp
+    return chatbot
+
+
+def chatbot_with_vectors():
+    chatbot = use_fake_nlp(Chatbot())
+    chatbot.vectorizer = chatbot.nlp.vector
+    return chatbot
+
+
+def test_similar_intent_reads_one_keyword_index_while_it_is_rebuilt():
+    chatbot = chatbot_with_vectors()
+    assert chatbot.similar_intent('recommend') == 'product_recommendation'
+
+    # Each rebuild adds a keyword ahead of "recommend", shifting its row
+    stop = threading.Event()
+
+    def add_keywords():
+        n = 0
+        while not stop.is_set():
+            chatbot.add_intent_keywords('greeting', [f'hello {n}'])
+            n += 1
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    thread = threading.Thread(target=add_keywords)
+    thread.start()
+    try:
+        for _ in range(5000):
+            assert chatbot.similar_intent('recommend') == 'product_recommendation'
+    finally:
+        sys.setswitchinterval(interval)
+        stop.set()
+        thread.join()
+
+
+def test_add_to_cart_message_adds_the_product_once(app, client, database):
+    use_fake_nlp(app.extensions['shop'].chatbot)
+    reply = client.post('/chatbot', json={'message': 'add idli mix to cart'}).get_json()
+    assert reply['response'].startswith('Idli Mix has been added to your cart')
+
+    with db.connection(database) as conn:
+        rows = conn.execute('SELECT p.name, c.quantity FROM cart_items c '
+                            'JOIN products p ON p.id = c.product_id').fetchall()
+    assert rows == [('Idli Mix', 1)]
+
+
+def test_messages_differing_in_product_or_order_id_share_a_cached_intent(monkeypatch):
+    chatbot = chatbot_with_vectors()
+    first = chatbot.resolve('add idli mix to cart')
+    first_order = chatbot.resolve('track order 41')
+
+    # Every later message must come from the cache
+    monkeypatch.setattr(chatbot, 'detect_intent', lambda message: 'should not run')
+    assert chatbot.resolve('Add  DOSA mix to cart') == (first[0], {'product_name': 'DOSA Mix', 'order_id': None})
+    assert chatbot.resolve('Track order 97') == (first_order[0], {'product_name': None, 'order_id': '97'})
+    assert first == ('order_placement', {'product_name': 'idli Mix', 'order_id': None})
+    assert first_order == ('order_tracking', {'product_name': None, 'order_id': '41'})
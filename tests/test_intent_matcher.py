@@ -0,0 +1,20 @@
+from intent_matcher import KeywordMatcher
+
+INTENTS = {
+    "greeting": ["hi", "hello"],
+    "order_tracking": ["track", "order", "where is"],
+}
+
+
+def test_keywords_match_whole_words_only():
+    matcher = KeywordMatcher(INTENTS)
+    assert matcher.best_intent("hi there") == "greeting"
+    assert matcher.best_intent("this is it") is None
+
+
+def test_plural_s_only_for_longer_keywords():
+    matcher = KeywordMatcher(INTENTS)
+    assert matcher.best_intent("track my orders") == "order_tracking"
+    # "his" is not a plural of "hi"
+    assert matcher.best_intent("where is his order") == "order_tracking"
+    assert matcher.best_intent("his") is None
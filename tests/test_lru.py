@@ -0,0 +1,46 @@
+from lru import LRUCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2, 'max_size': 2,
+                             'hit_rate': 0.75}
+
+
+def test_entries_expire_at_the_sooner_of_ttl_and_their_own_expiry():
+    clock = Clock()
+    cache = LRUCache(10, ttl=10, clock=clock)
+    cache.put('default', 1)
+    cache.put('sooner', 2, expires=5)
+    cache.put('later', 3, expires=60)
+    clock.now = 5
+    assert (cache.get('default'), cache.get('sooner'), cache.peek('later')) == (1, None, 3)
+    clock.now = 10
+    assert (cache.get('default'), cache.get('later')) == (None, None)
+    assert len(cache) == 0
+
+
+def test_invalid_values_count_as_misses_and_size_zero_caches_nothing():
+    cache = LRUCache(10)
+    cache.put('cart', ('items', 3))
+    assert cache.get('cart', valid=lambda value: value[1] == 4) is None
+    assert cache.get('cart', valid=lambda value: value[1] == 3) == ('items', 3)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    disabled = LRUCache(0)
+    disabled.put('a', 1)
+    assert disabled.get('a') is None
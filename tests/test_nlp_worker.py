@@ -0,0 +1,49 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from nlp_worker import NLPUnavailable, NLPWorker
+
+
+class FakeNLP:
+    """Records the size of every batch; a document's vector is its text's length"""
+
+    def __init__(self):
+        self.batches = []
+
+    def pipe(self, texts, batch_size):
+        self.batches.append(len(texts))
+        return [SimpleNamespace(vector=len(text)) for text in texts]
+
+
+def test_messages_arriving_together_share_a_batch():
+    nlp = FakeNLP()
+    worker = NLPWorker(lambda: nlp, batch_size=16, wait=0.05)
+    try:
+        futures = [worker.submit('x' * n) for n in range(1, 11)]
+        assert [future.result(timeout=5) for future in futures] == list(range(1, 11))
+        assert len(nlp.batches) < 10
+    finally:
+        worker.stop()
+
+
+def test_full_queue_and_failed_load_are_reported():
+    loading = threading.Event()
+
+    def load():
+        loading.wait()
+        raise OSError('no model')
+
+    worker = NLPWorker(load, queue_size=1)
+    try:
+        first = worker.submit('first')
+        with pytest.raises(NLPUnavailable, match='NLP queue is full'):
+            worker.submit('second')
+        loading.set()
+        with pytest.raises(OSError, match='no model'):
+            first.result(timeout=5)
+        with pytest.raises(OSError, match='no model'):
+            worker.vector('third')
+    finally:
+        worker.stop()
@@ -0,0 +1,61 @@
+import threading
+
+import db
+from order_status import REFUSALS, cancel_order, refusal, sweep_delivered
+
+
+def add_order(database, user_id=1, age_hours=0, status='pending'):
+    with db.connection(database) as conn:
+        order_id = conn.execute('''
+            INSERT INTO orders (user_id, total_amount, status, shipping_address, created_at)
+            VALUES (?, 10, ?, 'x', datetime('now', ?))
+        ''', (user_id, status, f'-{age_hours} hours')).lastrowid
+        conn.commit()
+    return order_id
+
+
+def status(database, order_id):
+    with db.connection(database) as conn:
+        return conn.execute('SELECT status FROM orders WHERE id = ?', (order_id,)).fetchone()[0]
+
+
+def test_exactly_one_of_many_concurrent_cancels_wins(database):
+    order_id = add_order(database)
+    start = threading.Barrier(8)
+    results = []
+
+    def cancel():
+        with db.connection(database) as conn:
+            start.wait()
+            results.append(cancel_order(conn, order_id, 1))
+
+    threads = [threading.Thread(target=cancel) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False] * 7 + [True]
+    assert status(database, order_id) == 'cancelled'
+    with db.connection(database) as conn:
+        assert refusal(conn, order_id, 1, 'cancelled') == REFUSALS[('cancelled', 'cancelled')]
+
+
+def test_order_older_than_a_day_is_refused(database):
+    order_id = add_order(database, age_hours=25)
+    with db.connection(database) as conn:
+        assert not cancel_order(conn, order_id, 1)
+        assert refusal(conn, order_id, 1, 'cancelled') == REFUSALS[('delivered', 'cancelled')]
+        # Still refused once the sweeper has marked it delivered
+        assert sweep_delivered(conn) == 1
+        assert not cancel_order(conn, order_id, 1)
+        assert refusal(conn, order_id, 1, 'cancelled') == REFUSALS[('delivered', 'cancelled')]
+    assert status(database, order_id) == 'delivered'
+
+
+def test_another_users_order_is_not_cancelled(database):
+    order_id = add_order(database, user_id=2)
+    with db.connection(database) as conn:
+        assert not cancel_order(conn, order_id, 1)
+        assert refusal(conn, order_id, 1, 'cancelled') == 'Order not found'
+    assert status(database, order_id) == 'pending'
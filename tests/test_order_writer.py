@@ -0,0 +1,87 @@
+import uuid
+
+import pytest
+
+import db
+from order_writer import Order, OrderWriter, OrderWriterBusy
+
+ITEMS = [{'id': 1, 'name': 'Idli Mix', 'price': 50.0, 'quantity': 2, 'subtotal': 100.0}]
+
+
+def order(key=None):
+    return Order(1, ITEMS, 100.0, 'Test User, 1 Main St, Chennai, TN 600001', key or uuid.uuid4().hex)
+
+
+def order_count(database, key=None):
+    with db.connection(database) as conn:
+        if key is None:
+            return conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM orders WHERE idempotency_key = ?', (key,)).fetchone()[0]
+
+
+@pytest.fixture
+def writer(database):
+    writer = OrderWriter(database, batch_size=32, wait=0.05, timeout=5)
+    yield writer
+    writer.stop()
+
+
+def test_orders_arriving_together_share_a_commit(writer, database):
+    futures = [writer.submit(order()) for _ in range(10)]
+    ids = [future.result(timeout=5) for future in futures]
+
+    assert len(set(ids)) == 10
+    assert order_count(database) == 10
+    assert writer.batches < 10
+
+
+def test_same_idempotency_key_places_one_order(writer, database):
+    key = uuid.uuid4().hex
+    # Twice in one batch, then again once that batch has committed
+    first, second = writer.submit(order(key)), writer.submit(order(key))
+    ids = {first.result(timeout=5), second.result(timeout=5), writer.place(order(key))}
+
+    assert len(ids) == 1
+    assert order_count(database, key) == 1
+    with db.connection(database) as conn:
+        assert conn.execute('SELECT item_count FROM orders WHERE idempotency_key = ?', (key,)).fetchone() == (2,)
+
+
+def test_timed_out_order_still_commits_once_and_a_retry_finds_it(writer, database):
+    key = uuid.uuid4().hex
+    with db.connection(database) as conn:
+        # Another writer holds the lock, so the writer thread waits inside its transaction
+        conn.execute('BEGIN IMMEDIATE')
+        future = writer.submit(order(key))
+        with pytest.raises(OrderWriterBusy):
+            writer.place(order(key), timeout=0.2)
+        conn.rollback()
+
+    order_id = future.result(timeout=5)
+    assert writer.place(order(key)) == order_id
+    assert order_count(database, key) == 1
+
+
+def test_checkout_that_times_out_keeps_its_idempotency_key(client, app, monkeypatch):
+    client.get('/add_to_cart/1')
+    form = {'idempotency_key': 'retry-key', 'full_name': 'Test', 'street': '1 Main St', 'city': 'Chennai',
+            'state': 'TN', 'zip_code': '600001', 'phone': '5550100'}
+    writer = app.extensions['shop'].order_writer
+    place = writer.place
+
+    def busy(order, timeout=None):
+        # The order is queued and will commit; only the wait for it gives up
+        place(order)
+        raise OrderWriterBusy('Timed out waiting for the order to be saved')
+
+    monkeypatch.setattr(writer, 'place', busy)
+    response = client.post('/checkout', data=form)
+    assert response.status_code == 503
+    assert b'value="retry-key"' in response.data
+    assert b'value="1 Main St"' in response.data
+
+    monkeypatch.setattr(writer, 'place', place)
+    response = client.post('/checkout', data=form)
+    assert response.status_code == 302
+    with db.connection(app.config['DATABASE']) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM orders WHERE idempotency_key = 'retry-key'").fetchone()[0] == 1
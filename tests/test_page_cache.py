@@ -0,0 +1,27 @@
+import db
+from order_writer import Order
+
+ITEMS = [{'id': 1, 'name': 'Idli Mix', 'price': 50.0, 'quantity': 2, 'subtotal': 100.0}]
+
+
+def test_order_pages_see_writes_made_by_another_worker(client, app, database):
+    client.get('/orders')  # Shows the login flash, so is not cached
+    order_id = app.extensions['shop'].order_writer.place(Order(1, ITEMS, 100.0, 'Test User, 1 Main St', None))
+    pages = app.extensions['shop'].pages
+    for _ in range(2):
+        assert b'Status: pending' in client.get('/orders').data
+        assert b'</strong> pending' in client.get(f'/order_confirmation/{order_id}').data
+    assert pages.stats()['hits'] == 2
+
+    # Another worker process: its own connection, none of this process's state
+    with db.connection(database) as conn:
+        conn.execute("UPDATE orders SET status = 'cancelled' WHERE id = ?", (order_id,))
+        conn.commit()
+    assert b'Status: cancelled' in client.get('/orders').data
+    assert b'</strong> cancelled' in client.get(f'/order_confirmation/{order_id}').data
+
+    with db.connection(database) as conn:
+        conn.execute("INSERT INTO orders (user_id, total_amount, status, shipping_address) "
+                     "VALUES (1, 10, 'pending', 'x')")
+        conn.commit()
+    assert client.get('/orders').data.count(b'<p class="order-status">') == 2
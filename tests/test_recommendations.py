@@ -0,0 +1,62 @@
+import time
+
+import db
+from recommendations import Recommender
+
+# Orders as lists of product ids: 1 and 2 are usually bought together
+ORDERS = [[1, 2], [1, 2], [1, 2, 3], [3, 4], [2]]
+
+
+def fill(database, orders=ORDERS, products=6):
+    with db.connection(database) as conn:
+        conn.executemany('INSERT INTO products (name, description, price, image) VALUES (?, ?, ?, ?)',
+                         [(f'Mix {n}', 'd', 10, 'i.png') for n in range(1, products + 1)])
+        for items in orders:
+            order_id = conn.execute("INSERT INTO orders (user_id, total_amount, status, shipping_address) "
+                                    "VALUES (1, 10, 'pending', 'x')").lastrowid
+            conn.executemany('INSERT INTO order_items (order_id, product_id, quantity, price_at_time) '
+                             'VALUES (?, ?, 1, 10)', [(order_id, product_id) for product_id in items])
+        conn.commit()
+
+
+def test_bought_together(database):
+    fill(database)
+    recommender = Recommender(database=database)
+    recommender.build()
+    assert recommender.similar(1)[0][0] == 2
+    assert recommender.recommend_for([1], k=1) == [2]
+
+
+def test_saved_index_loads_the_same(database, tmp_path):
+    fill(database)
+    built = Recommender(database=database)
+    built.build()
+    built.save(str(tmp_path / 'index.npz'))
+
+    loaded = Recommender(index_path=str(tmp_path / 'index.npz'))
+    loaded.refresh()
+    for product_id in range(1, 5):
+        assert loaded.similar(product_id) == built.similar(product_id)
+    assert loaded._popular == built._popular
+
+
+def test_reads_never_wait_for_a_build(database):
+    fill(database)
+    recommender = Recommender(database=database)
+    # Not built: answers straight away from the catalog, and builds in the background
+    with db.connection(database) as conn:
+        assert len(recommender.recommend(conn, 2, k=3)) == 3
+    deadline = time.monotonic() + 5
+    while recommender._built_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert recommender.similar(1)[0][0] == 2
+
+
+def test_a_new_store_still_gets_suggestions(database):
+    fill(database, orders=[])
+    recommender = Recommender(database=database)
+    recommender.build()
+    with db.connection(database) as conn:
+        suggestions = recommender.recommend(conn, 1, k=3)
+    assert len(set(suggestions)) == 3
+    assert set(suggestions) <= set(range(1, 7))
@@ -0,0 +1,11 @@
+def search(client, **params):
+    return client.get('/search', query_string=dict(params, format='json')).get_json()
+
+
+def test_limit_is_clamped(client):
+    everything = search(client, q='mix', limit=100)
+    assert len(everything) > 2
+    assert len(search(client, q='mix', limit=1)) == 1
+    # Not "no limit", and never cut from the end
+    assert search(client, q='mix', limit=-2) == everything[:1]
+    assert search(client, q='mix', limit=0) == everything[:1]
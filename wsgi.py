@@ -0,0 +1,45 @@
+"""Production entry point for preforking WSGI servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py preloads the app, so this module runs once, in the master
+process, before any worker is forked. It applies pending migrations, loads
+the NLP model and the recommendation index, and freezes the garbage
+collector's view of the heap; the workers then share the model's pages
+copy-on-write instead of each loading its own copy. Set INIT_DB=0 to leave
+migrations to `flask init-db`, and PRELOAD_NLP=0 to load the model lazily in
+each worker instead.
+
+With several workers, chat rate limits are kept in SQLite so they hold
+across all of them; set CHAT_RATE_LIMIT_SHARED=0 for per-worker buckets.
+gunicorn listens on 127.0.0.1 behind a reverse proxy, so the client address
+is taken from the last X-Forwarded-For hop; set PROXY_FIX_X_FOR to the number
+of proxies in front of it, or 0 when clients connect directly.
+"""
+import gc
+import os
+
+from app import create_app, init_db
+from recommendations import recommender
+
+os.environ.setdefault('CHAT_RATE_LIMIT_SHARED', '1')
+os.environ.setdefault('PROXY_FIX_X_FOR', '1')
+app = create_app()
+
+if os.environ.get('INIT_DB', '1') == '1':
+    init_db(app.config['DATABASE'])
+
+if os.environ.get('PRELOAD_NLP', '1') == '1':
+    try:
+        app.extensions['shop'].chatbot.load_nlp()
+    except Exception as e:
+        print(f"Chatbot preload failed, workers will load the model on first use: {str(e)}")
+
+try:
+    recommender.refresh()
+except Exception as e:
+    print(f"Recommendation index preload failed, workers will build it in the background: {str(e)}")
+
+# Objects that exist now live as long as the workers; keeping the collector
+# off them stops each worker from writing to, and so copying, their pages
+gc.freeze()